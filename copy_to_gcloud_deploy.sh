@@ -1,8 +1,9 @@
 #!/bin/bash
 echo "Starting deployment preparation..."
 if [ -d "gcloud_deploy" ]; then
-    echo "Cleaning gcloud_deploy directory (preserving main.py)..."
-    find gcloud_deploy -mindepth 1 ! -name 'main.py' ! -name 'dockerfile' -delete
+    echo "Cleaning gcloud_deploy directory (preserving main.py and the session store)..."
+    find gcloud_deploy -mindepth 1 ! -name 'main.py' ! -name 'dockerfile' \
+        ! -name 'session_store.py' ! -name 'bench_session_store.py' -delete
 fi
 
 echo "Creating new deployment structure..."
@@ -40,6 +41,12 @@ for agent in "${AGENTS[@]}"; do
   uv pip install -e "./${agent}"
 done
 
+# OTLP span export of the agent runs (see gcloud_deploy/main.py)
+uv pip install opentelemetry-exporter-otlp-proto-http
+
+# Pooled session store drivers (see gcloud_deploy/session_store.py)
+uv pip install aiosqlite asyncpg
+
 uv pip list
 
 uv pip freeze | grep -v "^-e" > gcloud_deploy/requirements.txt
@@ -0,0 +1,186 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from cache import parse_agent_map
+from metrics import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_WAIT,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+)
+
+
+# Upstream calls running at once per agent, and calls waiting behind them
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "32"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "64"))
+# Per agent overrides, "agent=number,...", e.g. "short_movie=4"
+ADMISSION_AGENT_MAX_IN_FLIGHT = os.environ.get("ADMISSION_AGENT_MAX_IN_FLIGHT", "")
+ADMISSION_AGENT_MAX_QUEUE = os.environ.get("ADMISSION_AGENT_MAX_QUEUE", "")
+# Queued calls give up after this many seconds
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "30"))
+
+# Lower value is admitted first; /query callers pick one with the header
+PRIORITIES = {"interactive": 0, "batch": 1}
+PRIORITY_HEADER = "x-request-priority"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, agent_name: str, retry_after: float):
+        super().__init__(
+            f"Agent {agent_name} is at capacity, retry in {retry_after:.0f}s"
+        )
+        self.agent_name = agent_name
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class Waiter:
+    priority: int
+    sequence: int
+    future: asyncio.Future = field(compare=False)
+
+
+class AgentGate:
+    """Bounded in-flight slots for one agent with a priority wait queue"""
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        # smoothed seconds a slot is held, for Retry-After estimates
+        self.hold_seconds = 1.0
+        self._waiters: list[Waiter] = []
+        self._sequence = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        # time for the queue ahead (and one more) to drain through the slots
+        turns = (self.queued + 1) / max(1, self.max_in_flight)
+        return max(1.0, turns * self.hold_seconds)
+
+    async def acquire(self, priority: int, max_wait: float) -> bool:
+        """Take a slot, waiting in line if needed; False if there's no room"""
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return True
+        if self.queued >= self.max_queue:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = Waiter(priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max_wait)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # the slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self, held: float | None = None):
+        if held is not None:
+            self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * held
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            if not waiter.future.done():
+                # hand the slot straight to the next in line
+                waiter.future.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionController:
+    """Per agent admission of upstream calls.
+
+    At most `max_in_flight` calls per agent run at once; up to `max_queue`
+    more wait, interactive ones ahead of batch ones. When the queue is full
+    (or a call waited `max_wait`) AdmissionRejected is raised right away, so
+    a spike turns into fast 429s instead of piling up upstream calls.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        agent_max_in_flight: dict[str, float] | None = None,
+        agent_max_queue: dict[str, float] | None = None,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.agent_max_in_flight = (
+            parse_agent_map(ADMISSION_AGENT_MAX_IN_FLIGHT)
+            if agent_max_in_flight is None
+            else agent_max_in_flight
+        )
+        self.agent_max_queue = (
+            parse_agent_map(ADMISSION_AGENT_MAX_QUEUE)
+            if agent_max_queue is None
+            else agent_max_queue
+        )
+        self.max_wait = max_wait
+        self._gates: dict[str, AgentGate] = {}
+
+    def gate(self, agent_name: str) -> AgentGate:
+        gate = self._gates.get(agent_name)
+        if gate is None:
+            gate = self._gates[agent_name] = AgentGate(
+                int(self.agent_max_in_flight.get(agent_name, self.max_in_flight)),
+                int(self.agent_max_queue.get(agent_name, self.max_queue)),
+            )
+        return gate
+
+    async def acquire(self, agent_name: str, priority: str = "interactive") -> float:
+        """Take a slot for the agent and return when it was taken"""
+        gate = self.gate(agent_name)
+        start = time.monotonic()
+        ADMISSION_QUEUED.inc(agent=agent_name)
+        try:
+            admitted = await gate.acquire(PRIORITIES[priority], self.max_wait)
+        finally:
+            ADMISSION_QUEUED.dec(agent=agent_name)
+        if not admitted:
+            ADMISSION_REJECTED.inc(agent=agent_name, priority=priority)
+            raise AdmissionRejected(agent_name, gate.retry_after())
+        now = time.monotonic()
+        ADMISSION_QUEUE_WAIT.observe(now - start, agent=agent_name, priority=priority)
+        ADMISSION_IN_FLIGHT.inc(agent=agent_name)
+        return now
+
+    def release(self, agent_name: str, acquired_at: float):
+        ADMISSION_IN_FLIGHT.dec(agent=agent_name)
+        self.gate(agent_name).release(time.monotonic() - acquired_at)
+
+    @asynccontextmanager
+    async def admit(self, agent_name: str, priority: str = "interactive"):
+        acquired_at = await self.acquire(agent_name, priority)
+        try:
+            yield
+        finally:
+            self.release(agent_name, acquired_at)
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            agent_name: {
+                "in_flight": gate.in_flight,
+                "queued": gate.queued,
+                "max_in_flight": gate.max_in_flight,
+                "max_queue": gate.max_queue,
+            }
+            for agent_name, gate in self._gates.items()
+        }
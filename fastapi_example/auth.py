@@ -0,0 +1,141 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import google.oauth2.id_token
+from google.auth.transport.requests import Request
+
+from tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = float(os.environ.get("ID_TOKEN_REFRESH_MARGIN", "300"))
+# Used when the token has no readable exp claim (Google ID tokens live 1h)
+TOKEN_DEFAULT_LIFETIME = float(os.environ.get("ID_TOKEN_DEFAULT_LIFETIME", "3600"))
+# "google" (metadata server / ADC) or "local" for stub agents and benchmarks
+ID_TOKEN_SOURCE = os.environ.get("ID_TOKEN_SOURCE", "google")
+
+
+TokenFetcher = Callable[[str], str]
+
+
+def fetch_google_id_token(audience: str) -> str:
+    """Blocking fetch of a Google ID token for the audience (agent url)"""
+    auth_req = Request()
+    return google.oauth2.id_token.fetch_id_token(auth_req, audience)
+
+
+def fetch_local_token(audience: str) -> str:
+    """Fake token source for local agents that don't check auth"""
+    return "local-token"
+
+
+def get_token_fetcher(source: str = ID_TOKEN_SOURCE) -> TokenFetcher:
+    if source == "local":
+        return fetch_local_token
+    return fetch_google_id_token
+
+
+def get_token_expiry(token: str) -> float | None:
+    """Read the exp claim from a JWT without verifying it"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+@dataclass
+class CachedToken:
+    token: str
+    expires_at: float
+
+    def is_valid(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def needs_refresh(self, now: float, margin: float) -> bool:
+        return now >= self.expires_at - margin
+
+
+class IdTokenProvider:
+    """Async, per-audience cache of ID tokens.
+
+    The blocking fetch runs in a worker thread, concurrent fetches for the
+    same audience share one call, and tokens close to expiry are refreshed
+    in the background while the cached one keeps being served. Pass a custom
+    `fetcher` (audience -> token) to run against a local fake token source.
+    """
+
+    def __init__(
+        self,
+        fetcher: TokenFetcher = fetch_google_id_token,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+        default_lifetime: float = TOKEN_DEFAULT_LIFETIME,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.fetcher = fetcher
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self.clock = clock
+        self._tokens: dict[str, CachedToken] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def get_token(self, audience: str) -> str:
+        """Return a valid ID token for the audience, fetching if needed"""
+        now = self.clock()
+        cached = self._tokens.get(audience)
+        if cached and cached.is_valid(now):
+            if cached.needs_refresh(now, self.refresh_margin):
+                # serve the current token, refresh behind it
+                self._start_fetch(audience)
+            return cached.token
+
+        cached = await asyncio.shield(self._start_fetch(audience))
+        return cached.token
+
+    def invalidate(self, audience: str):
+        """Drop the cached token, e.g. after the agent rejected it"""
+        self._tokens.pop(audience, None)
+
+    def _start_fetch(self, audience: str) -> asyncio.Task:
+        task = self._inflight.get(audience)
+        if task is None:
+            task = asyncio.create_task(self._fetch(audience))
+            self._inflight[audience] = task
+            task.add_done_callback(lambda t: self._on_fetch_done(audience, t))
+        return task
+
+    def _on_fetch_done(self, audience: str, task: asyncio.Task):
+        self._inflight.pop(audience, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(
+                f"ID token fetch for {audience} failed: {task.exception()}"
+            )
+
+    @tracer.start_as_current_span("id_token.fetch")
+    async def _fetch(self, audience: str) -> CachedToken:
+        token = await asyncio.to_thread(self.fetcher, audience)
+        expires_at = get_token_expiry(token) or (
+            self.clock() + self.default_lifetime
+        )
+        cached = CachedToken(token=token, expires_at=expires_at)
+        self._tokens[audience] = cached
+        return cached
+
+    async def aclose(self):
+        """Cancel background refreshes, called on app shutdown"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inflight.clear()
@@ -0,0 +1,132 @@
+"""Micro-benchmark: buffered parse_response vs the incremental event decoder.
+
+Run from fastapi_example/:
+
+    python benchmarks/bench_parse_response.py
+    python benchmarks/bench_parse_response.py --file recorded_run.json
+
+Without --file a travel_concierge-like /run response is synthesized from
+the Seattle itinerary profile (function calls and responses carrying the
+itinerary, plus long text answers).
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from event_parser import EventArrayDecoder, parse_event  # noqa: E402
+from models import AgentAnswerPart  # noqa: E402
+
+
+ITINERARY_PROFILE = (
+    Path(__file__).resolve().parents[2]
+    / "travel_concierge/travel_concierge/profiles/itinerary_seattle_example.json"
+)
+
+
+def legacy_parse_response(response_text: str) -> list[AgentAnswerPart]:
+    """parse_response as it was before the incremental decoder"""
+    data = json.loads(response_text)
+    agent_answer_parts: list[AgentAnswerPart] = []
+    for part in data:
+        agent_name = part.get("author", "")
+        content = part.get("content", "")
+        if content.get("role") == "model":
+            parts = content.get("parts", [])
+            inside_part = parts[0]
+            if "text" in inside_part:
+                agent_answer_parts.append(
+                    AgentAnswerPart(agent_name=agent_name, text=inside_part["text"])
+                )
+    return agent_answer_parts
+
+
+def synthesize_response(events: int) -> bytes:
+    itinerary = json.loads(ITINERARY_PROFILE.read_text())["state"]["itinerary"]
+    text = "Here is the updated plan for your trip to Seattle. " * 40
+    body = []
+    for i in range(events):
+        author = ("planning_agent", "itinerary_agent", "root_agent")[i % 3]
+        if i % 3 == 0:
+            part = {"functionCall": {"name": "memorize", "args": itinerary}}
+            role = "model"
+        elif i % 3 == 1:
+            part = {"functionResponse": {"name": "memorize", "response": itinerary}}
+            role = "user"
+        else:
+            part = {"text": text}
+            role = "model"
+        body.append(
+            {
+                "id": f"event-{i}",
+                "author": author,
+                "invocationId": "e-1",
+                "content": {"role": role, "parts": [part]},
+                "actions": {"stateDelta": {}, "artifactDelta": {}},
+                "timestamp": 1761122677.0 + i,
+            }
+        )
+    return json.dumps(body).encode()
+
+
+def run_legacy(body: bytes, chunk_size: int) -> int:
+    # the old path: httpx joins the chunks, decodes .text, then json.loads
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    return len(legacy_parse_response(b"".join(chunks).decode()))
+
+
+def run_incremental(body: bytes, chunk_size: int) -> int:
+    decoder = EventArrayDecoder()
+    parts = 0
+    for i in range(0, len(body), chunk_size):
+        for event in decoder.feed(body[i : i + chunk_size]):
+            parts += len(parse_event(event))
+    for event in decoder.close():
+        parts += len(parse_event(event))
+    return parts
+
+
+def measure(name: str, fn, body: bytes, chunk_size: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parts = fn(body, chunk_size)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(body, chunk_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    print(
+        f"{name:<12} parts={parts:<6} "
+        f"best={timings[0] * 1000:8.2f} ms  "
+        f"median={timings[len(timings) // 2] * 1000:8.2f} ms  "
+        f"peak_mem={peak / 1024 / 1024:8.2f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", help="recorded /run response body (JSON array)")
+    parser.add_argument("--events", type=int, default=3000)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body = (
+        Path(args.file).read_bytes() if args.file else synthesize_response(args.events)
+    )
+    print(f"body size: {len(body) / 1024 / 1024:.2f} MiB")
+    measure("legacy", run_legacy, body, args.chunk_size, args.repeat)
+    measure("incremental", run_incremental, body, args.chunk_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
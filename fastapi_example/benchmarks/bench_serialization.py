@@ -0,0 +1,102 @@
+"""Micro-benchmark: QueryResponse serialization and bytes on the wire.
+
+Compares the stdlib JSONResponse the gateway used to render with the
+orjson-backed ORJSONResponse, then the size and CPU cost of gzip and
+brotli (when installed) on the rendered body. Run from fastapi_example/:
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --file recorded_run.json
+
+The QueryResponse is built from a recorded /run response body (--file), or
+from one synthesized from the Seattle itinerary profile like in
+bench_parse_response.py.
+"""
+
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_parse_response import synthesize_response  # noqa: E402
+from event_parser import EventArrayDecoder, parse_event  # noqa: E402
+from models import QueryResponse  # noqa: E402
+from responses import (  # noqa: E402
+    BROTLI_AVAILABLE,
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_GZIP_LEVEL,
+    ORJSONResponse,
+)
+
+
+def build_response(body: bytes) -> dict:
+    """The gateway's QueryResponse as FastAPI hands it to the response class"""
+    decoder = EventArrayDecoder()
+    events = decoder.feed(body) + decoder.close()
+    answer = [part for event in events for part in parse_event(event)]
+    response = QueryResponse(success=True, query="Plan my Seattle trip", answer=answer)
+    return response.model_dump(mode="json")
+
+
+def best_of(fn, repeat: int) -> tuple[float, object]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", help="recorded /run response body (JSON array)")
+    parser.add_argument("--events", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    body = (
+        Path(args.file).read_bytes() if args.file else synthesize_response(args.events)
+    )
+    content = build_response(body)
+
+    print("serialization")
+    rendered = {}
+    for name, response_class in (
+        ("json", JSONResponse),
+        ("orjson", ORJSONResponse),
+    ):
+        seconds, rendered[name] = best_of(
+            lambda: response_class(content).body, args.repeat
+        )
+        print(
+            f"  {name:<8} best={seconds * 1000:8.2f} ms  "
+            f"size={len(rendered[name]) / 1024:9.1f} KiB"
+        )
+
+    print("bytes on the wire")
+    payload = rendered["orjson"]
+    codings = [("identity", lambda: payload)]
+    codings.append(
+        ("gzip", lambda: gzip.compress(payload, compresslevel=COMPRESSION_GZIP_LEVEL))
+    )
+    if BROTLI_AVAILABLE:
+        import brotli
+
+        codings.append(
+            ("br", lambda: brotli.compress(payload, quality=COMPRESSION_BROTLI_QUALITY))
+        )
+    for name, fn in codings:
+        seconds, encoded = best_of(fn, args.repeat)
+        print(
+            f"  {name:<8} best={seconds * 1000:8.2f} ms  "
+            f"size={len(encoded) / 1024:9.1f} KiB  "
+            f"ratio={len(payload) / len(encoded):5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Load test of the gateway against the local stub agent.
+
+Starts benchmarks/stub_agent.py and the gateway (main.py) as subprocesses,
+registers the stub in a throwaway agent registry, then drives /query (or
+/query/stream) at the given concurrency and reports throughput and the
+latency distribution. Run from fastapi_example/:
+
+    python benchmarks/load_test.py --concurrency 32 --requests 2000 \
+        --stub-latency-ms 200 --stub-payload-bytes 5000
+
+Use --gateway-url / --agent-url to point at servers that are already
+running instead (the agent must then be registered for --user-email).
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+GATEWAY_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(GATEWAY_DIR))
+
+from health import percentile  # noqa: E402
+from registry import AgentRegistry  # noqa: E402
+
+
+def start_process(args: list[str], env: dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args], cwd=GATEWAY_DIR, env={**os.environ, **env}
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def query_once(client: httpx.AsyncClient, args, index: int) -> tuple[float, bool]:
+    body = {
+        "auth": {"user_email": args.user_email, "agent_name": args.agent_name},
+        "query": f"{args.query} #{index}" if args.unique_queries else args.query,
+        "timeout": args.timeout,
+    }
+    headers = {"X-Cache-Bypass": "1"} if args.bypass_cache else {}
+    start = time.perf_counter()
+    try:
+        if args.endpoint == "/query/stream":
+            ok = False
+            async with client.stream(
+                "POST", args.endpoint, json=body, headers=headers
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: error"):
+                        break
+                    if line.startswith("event: done"):
+                        ok = True
+        else:
+            response = await client.post(args.endpoint, json=body, headers=headers)
+            ok = response.status_code == 200 and response.json().get("success", False)
+    except httpx.HTTPError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+async def drive(args) -> tuple[list[float], int, float]:
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for index in counter:
+            latency, ok = await query_once(client, args, index)
+            latencies.append(latency)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.gateway_url, limits=limits, timeout=args.timeout + 30
+    ) as client:
+        # one request first so cold paths (token, pool, session) don't skew
+        await query_once(client, args, -1)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def report(latencies: list[float], errors: int, elapsed: float, args):
+    latencies.sort()
+    print(
+        f"endpoint={args.endpoint} concurrency={args.concurrency} "
+        f"requests={len(latencies)} errors={errors}"
+    )
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s over {elapsed:.2f}s")
+    quantiles = (0.5, 0.9, 0.95, 0.99)
+    print(
+        "latency ms: "
+        + "  ".join(
+            f"p{int(q * 100)}={percentile(latencies, q) * 1000:.1f}" for q in quantiles
+        )
+        + f"  max={latencies[-1] * 1000:.1f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Gateway load test")
+    parser.add_argument("--gateway-url", help="use a running gateway")
+    parser.add_argument("--agent-url", help="use a running (stub) agent")
+    parser.add_argument("--gateway-port", type=int, default=8010)
+    parser.add_argument("--stub-port", type=int, default=8011)
+    parser.add_argument("--gateway-workers", type=int, default=1)
+    parser.add_argument("--endpoint", default="/query", choices=["/query", "/query/stream"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--user-email", default="bench@example.com")
+    parser.add_argument("--agent-name", default="llm_auditor")
+    parser.add_argument("--query", default="Who was in Paris?")
+    parser.add_argument(
+        "--unique-queries", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument(
+        "--same-query",
+        dest="unique_queries",
+        action="store_false",
+        help="same as --no-unique-queries",
+    )
+    parser.add_argument(
+        "--bypass-cache", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument(
+        "--use-cache",
+        dest="bypass_cache",
+        action="store_false",
+        help="same as --no-bypass-cache",
+    )
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--stub-latency-ms", type=float, default=100)
+    parser.add_argument("--stub-jitter-ms", type=float, default=0)
+    parser.add_argument("--stub-events", type=int, default=3)
+    parser.add_argument("--stub-payload-bytes", type=int, default=1000)
+    parser.add_argument("--stub-error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        if not args.agent_url:
+            args.agent_url = f"http://127.0.0.1:{args.stub_port}"
+            processes.append(
+                start_process(
+                    [
+                        "benchmarks/stub_agent.py",
+                        f"--port={args.stub_port}",
+                        f"--latency-ms={args.stub_latency_ms}",
+                        f"--jitter-ms={args.stub_jitter_ms}",
+                        f"--events={args.stub_events}",
+                        f"--payload-bytes={args.stub_payload_bytes}",
+                        f"--error-rate={args.stub_error_rate}",
+                    ],
+                    env={},
+                )
+            )
+            await wait_ready(f"{args.agent_url}/list-apps")
+
+        if not args.gateway_url:
+            args.gateway_url = f"http://127.0.0.1:{args.gateway_port}"
+            state_dir = tempfile.mkdtemp()
+            registry_path = os.path.join(state_dir, "agent_registry.db")
+            registry = AgentRegistry(registry_path)
+            registry.open()
+            registry.save_agent_url(args.user_email, args.agent_name, args.agent_url)
+            registry.close()
+            processes.append(
+                start_process(
+                    [
+                        "-m",
+                        "uvicorn",
+                        "main:app",
+                        f"--port={args.gateway_port}",
+                        f"--workers={args.gateway_workers}",
+                        "--log-level=warning",
+                    ],
+                    env={
+                        "AGENT_REGISTRY_PATH": registry_path,
+                        "ID_TOKEN_SOURCE": "local",
+                        # measure the gateway, not the rate limits; fresh
+                        # buckets so runs don't carry over into each other
+                        "RATE_LIMIT_USER_PER_MINUTE": "0",
+                        "RATE_LIMIT_AGENT_PER_MINUTE": "0",
+                        "RATE_LIMIT_PATH": os.path.join(state_dir, "rate_limits.db"),
+                        "DEPLOY_JOBS_PATH": os.path.join(state_dir, "deploy_jobs.db"),
+                    },
+                )
+            )
+            await wait_ready(f"{args.gateway_url}/metrics")
+
+        latencies, errors, elapsed = await drive(args)
+        report(latencies, errors, elapsed, args)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
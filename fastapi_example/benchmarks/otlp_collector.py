@@ -0,0 +1,131 @@
+"""Stand-in OTLP/HTTP trace collector for checking tracing locally.
+
+Accepts what the OpenTelemetry OTLP/HTTP exporters send to /v1/traces
+(protobuf or JSON), keeps the spans in memory and prints them as trace
+trees. Run it, then start the gateway and/or gcloud_deploy with
+OTEL_EXPORTER_OTLP_ENDPOINT pointing at it:
+
+    python benchmarks/otlp_collector.py --port 4318
+    OTEL_EXPORTER_OTLP_ENDPOINT=http://127.0.0.1:4318 uvicorn main:app
+
+GET /traces returns the collected spans grouped by trace id, DELETE /traces
+clears them. Needs the opentelemetry-proto package (installed with the
+OTLP exporter).
+"""
+
+import argparse
+from collections import defaultdict
+
+from fastapi import FastAPI, Request, Response
+from google.protobuf import json_format
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+    ExportTraceServiceResponse,
+)
+
+
+app = FastAPI()
+spans: list[dict] = []
+print_spans = True
+
+
+def attribute_value(value) -> object:
+    kind = value.WhichOneof("value")
+    return getattr(value, kind) if kind else None
+
+
+def span_record(service: str, span) -> dict:
+    return {
+        "trace_id": span.trace_id.hex(),
+        "span_id": span.span_id.hex(),
+        "parent_span_id": span.parent_span_id.hex(),
+        "name": span.name,
+        "service": service,
+        "start_ns": span.start_time_unix_nano,
+        "duration_ms": (span.end_time_unix_nano - span.start_time_unix_nano) / 1e6,
+        "attributes": {a.key: attribute_value(a.value) for a in span.attributes},
+        "error": span.status.code == span.status.STATUS_CODE_ERROR,
+    }
+
+
+def print_tree(trace_spans: list[dict]):
+    children = defaultdict(list)
+    ids = {span["span_id"] for span in trace_spans}
+    for span in sorted(trace_spans, key=lambda s: s["start_ns"]):
+        parent = span["parent_span_id"] if span["parent_span_id"] in ids else ""
+        children[parent].append(span)
+
+    def walk(parent: str, depth: int):
+        for span in children[parent]:
+            flag = " ERROR" if span["error"] else ""
+            print(
+                f"{'  ' * depth}{span['service']}: {span['name']} "
+                f"{span['duration_ms']:.1f}ms{flag}"
+            )
+            walk(span["span_id"], depth + 1)
+
+    print(f"trace {trace_spans[0]['trace_id']}")
+    walk("", 1)
+
+
+@app.post("/v1/traces")
+async def export_traces(request: Request):
+    body = await request.body()
+    export = ExportTraceServiceRequest()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        json_format.Parse(body, export)
+    else:
+        export.ParseFromString(body)
+
+    received = []
+    for resource_spans in export.resource_spans:
+        attributes = {
+            a.key: attribute_value(a.value) for a in resource_spans.resource.attributes
+        }
+        service = attributes.get("service.name", "unknown")
+        for scope_spans in resource_spans.scope_spans:
+            received.extend(span_record(service, span) for span in scope_spans.spans)
+    spans.extend(received)
+
+    if print_spans:
+        by_trace = defaultdict(list)
+        for span in received:
+            by_trace[span["trace_id"]].append(span)
+        for trace_spans in by_trace.values():
+            print_tree(trace_spans)
+
+    return Response(
+        ExportTraceServiceResponse().SerializeToString(),
+        media_type="application/x-protobuf",
+    )
+
+
+@app.get("/traces")
+async def list_traces():
+    by_trace = defaultdict(list)
+    for span in spans:
+        by_trace[span["trace_id"]].append(span)
+    return by_trace
+
+
+@app.delete("/traces")
+async def clear_traces():
+    spans.clear()
+
+
+def main():
+    global print_spans
+    parser = argparse.ArgumentParser(description="Stand-in OTLP trace collector")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--quiet", action="store_true", help="don't print spans")
+    args = parser.parse_args()
+    print_spans = not args.quiet
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
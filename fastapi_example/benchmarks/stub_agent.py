@@ -0,0 +1,160 @@
+"""Stub ADK agent server for benchmarking the gateway without Cloud Run.
+
+Implements the parts of the ADK api server the gateway talks to:
+
+    POST /apps/{app}/users/{user}/sessions
+    GET  /apps/{app}/users/{user}/sessions/{session_id}
+    POST /run
+    POST /run_sse
+    GET  /list-apps, /health
+
+Latency, payload size, number of events and error rate are configurable:
+
+    python benchmarks/stub_agent.py --port 8001 --latency-ms 200 --events 4 \
+        --payload-bytes 2000 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+class StubSettings(BaseModel):
+    latency_ms: float = float(os.environ.get("STUB_LATENCY_MS", "100"))
+    jitter_ms: float = float(os.environ.get("STUB_JITTER_MS", "0"))
+    session_latency_ms: float = float(os.environ.get("STUB_SESSION_LATENCY_MS", "10"))
+    events: int = int(os.environ.get("STUB_EVENTS", "3"))
+    payload_bytes: int = int(os.environ.get("STUB_PAYLOAD_BYTES", "1000"))
+    error_rate: float = float(os.environ.get("STUB_ERROR_RATE", "0"))
+
+
+class CreateSessionBody(BaseModel):
+    session_id: str | None = None
+    state: dict = {}
+
+
+settings = StubSettings()
+sessions: dict[tuple[str, str, str], dict] = {}
+
+app = FastAPI()
+
+
+def session_json(app_name: str, user_id: str, session_id: str) -> dict:
+    return {
+        "id": session_id,
+        "appName": app_name,
+        "userId": user_id,
+        "state": {},
+        "events": [],
+        "lastUpdateTime": time.time(),
+    }
+
+
+def make_event(app_name: str, index: int) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "invocationId": "e-stub",
+        "author": f"{app_name}_sub_agent_{index}",
+        "content": {"role": "model", "parts": [{"text": "x" * settings.payload_bytes}]},
+        "actions": {"stateDelta": {}, "artifactDelta": {}},
+        "timestamp": time.time(),
+    }
+
+
+async def simulate_latency(latency_ms: float):
+    jitter = random.uniform(-settings.jitter_ms, settings.jitter_ms)
+    await asyncio.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+
+def maybe_fail():
+    if random.random() < settings.error_rate:
+        raise HTTPException(status_code=500, detail="Injected stub error")
+
+
+def require_session(body: dict):
+    key = (body["appName"], body["userId"], body["sessionId"])
+    if key not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@app.get("/health")
+@app.get("/list-apps")
+async def health():
+    return ["stub"]
+
+
+@app.post("/apps/{app_name}/users/{user_id}/sessions")
+async def create_session(app_name: str, user_id: str, body: CreateSessionBody):
+    await simulate_latency(settings.session_latency_ms)
+    maybe_fail()
+    session_id = body.session_id or uuid.uuid4().hex
+    session = session_json(app_name, user_id, session_id)
+    sessions[(app_name, user_id, session_id)] = session
+    return session
+
+
+@app.get("/apps/{app_name}/users/{user_id}/sessions/{session_id}")
+async def read_session(app_name: str, user_id: str, session_id: str):
+    await simulate_latency(settings.session_latency_ms)
+    session = sessions.get((app_name, user_id, session_id))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.post("/run")
+async def run(body: dict):
+    require_session(body)
+    await simulate_latency(settings.latency_ms)
+    maybe_fail()
+    return JSONResponse(
+        [make_event(body["appName"], i) for i in range(settings.events)]
+    )
+
+
+@app.post("/run_sse")
+async def run_sse(body: dict):
+    require_session(body)
+    maybe_fail()
+
+    async def events():
+        # spread the run latency over the events, like a multi-agent run
+        for i in range(settings.events):
+            await simulate_latency(settings.latency_ms / max(1, settings.events))
+            yield f"data: {json.dumps(make_event(body['appName'], i))}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub ADK agent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=settings.jitter_ms)
+    parser.add_argument(
+        "--session-latency-ms", type=float, default=settings.session_latency_ms
+    )
+    parser.add_argument("--events", type=int, default=settings.events)
+    parser.add_argument("--payload-bytes", type=int, default=settings.payload_bytes)
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate)
+    args = parser.parse_args()
+
+    for field in StubSettings.model_fields:
+        setattr(settings, field, getattr(args, field))
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
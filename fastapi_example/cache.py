@@ -0,0 +1,97 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from models import QueryRequest, QueryResponse
+
+
+# Opt-in per agent, "agent=ttl_seconds,...", e.g. "rag=300"
+RESPONSE_CACHE_AGENTS = os.environ.get("RESPONSE_CACHE_AGENTS", "")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+CACHE_BYPASS_HEADER = "x-cache-bypass"
+
+
+def parse_agent_map(value: str) -> dict[str, float]:
+    """Parse "agent=number,agent=number" settings"""
+    result = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        agent_name, number = item.split("=", 1)
+        result[agent_name.strip()] = float(number)
+    return result
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+@dataclass
+class CacheEntry:
+    response: QueryResponse
+    expires_at: float
+
+
+class ResponseCache:
+    """TTL + LRU cache of successful QueryResponses for read-only agents.
+
+    Only agents listed in `ttls` are cached, and only session-less queries:
+    a query inside an existing session depends on the conversation so far.
+    """
+
+    def __init__(
+        self,
+        ttls: dict[str, float] | None = None,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.ttls = parse_agent_map(RESPONSE_CACHE_AGENTS) if ttls is None else ttls
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+
+    def _key(self, request: QueryRequest) -> tuple[str, str] | None:
+        if request.current_session_id or request.auth.agent_name not in self.ttls:
+            return None
+        return (request.auth.agent_name, normalize_query(request.query))
+
+    def lookup(self, request: QueryRequest) -> QueryResponse | None:
+        key = self._key(request)
+        if key is None:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.response.model_copy(update={"query": request.query})
+
+    def store(self, request: QueryRequest, response: QueryResponse):
+        key = self._key(request)
+        if key is None or not response.success:
+            return
+
+        self._entries[key] = CacheEntry(
+            response=response, expires_at=time.monotonic() + self.ttls[key[0]]
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "agents": self.ttls,
+        }
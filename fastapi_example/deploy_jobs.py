@@ -0,0 +1,390 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+from models import DeployJobEvent, DeployJobStatus, DeployRequestInner, DeployResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+# Deploys run concurrently up to this many (one per agent for a full batch)
+DEPLOY_WORKERS = int(os.environ.get("DEPLOY_WORKERS", "5"))
+# Finished jobs kept for status lookups
+DEPLOY_JOBS_RETAINED = int(os.environ.get("DEPLOY_JOBS_RETAINED", "500"))
+# Job status and events, shared by every gateway worker; own database, a
+# write to the registry file would drop every worker's registry cache
+DEPLOY_JOBS_PATH = os.environ.get("DEPLOY_JOBS_PATH", "deploy_jobs.db")
+# How often a worker following another worker's job checks for new events
+DEPLOY_JOBS_POLL_INTERVAL = float(os.environ.get("DEPLOY_JOBS_POLL_INTERVAL", "1"))
+# How often a worker marks the unfinished jobs it owns as still alive
+DEPLOY_JOBS_HEARTBEAT_INTERVAL = float(
+    os.environ.get("DEPLOY_JOBS_HEARTBEAT_INTERVAL", "10")
+)
+# An unfinished job without a heartbeat for this long lost its worker
+# (crash, restart) and is marked failed
+DEPLOY_JOBS_STALE_SECONDS = float(os.environ.get("DEPLOY_JOBS_STALE_SECONDS", "60"))
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deploy_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    finished INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deploy_job_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deploy_job_events_by_job
+    ON deploy_job_events (job_id, seq);
+"""
+
+
+ProgressReporter = Callable[[str], None]
+DeployRunner = Callable[
+    [DeployRequestInner, str, ProgressReporter], Awaitable[DeployResponse]
+]
+
+
+class DeployJobStore:
+    """Deploy job status and events in SQLite (WAL), so a job started on one
+    uvicorn worker can be looked up and followed from any other.
+
+    `updated_at` doubles as the owning worker's heartbeat; the database is
+    opened by `open()`, when the DeployJobManager starts.
+    """
+
+    def __init__(self, path: str = DEPLOY_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def open(self):
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=5
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def save(self, status: DeployJobStatus, event: DeployJobEvent):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._write(status, event)
+            self._conn.execute("COMMIT")
+
+    def _write(self, status: DeployJobStatus, event: DeployJobEvent):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO deploy_jobs VALUES (?, ?, ?, ?)",
+            (
+                status.job_id,
+                status.model_dump_json(),
+                status.status in FINISHED_STATUSES,
+                status.updated_at,
+            ),
+        )
+        self._conn.execute(
+            "INSERT INTO deploy_job_events (job_id, event) VALUES (?, ?)",
+            (status.job_id, event.model_dump_json()),
+        )
+
+    def get(self, job_id: str) -> DeployJobStatus | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM deploy_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else DeployJobStatus.model_validate_json(row[0])
+
+    def events(self, job_id: str, after: int = 0) -> list[tuple[int, DeployJobEvent]]:
+        """(seq, event) of the job's events after seq `after`, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM deploy_job_events"
+                " WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [(seq, DeployJobEvent.model_validate_json(event)) for seq, event in rows]
+
+    def heartbeat(self, job_ids: list[str]):
+        """Mark the unfinished jobs as still running on a live worker"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE deploy_jobs SET updated_at = ?"
+                " WHERE job_id = ? AND NOT finished",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def fail_if_stale(
+        self, job_id: str, stale_after: float = DEPLOY_JOBS_STALE_SECONDS
+    ):
+        """Fail the job if it is unfinished and its worker went silent"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT status FROM deploy_jobs"
+                    " WHERE job_id = ? AND NOT finished AND updated_at < ?",
+                    (job_id, now - stale_after),
+                ).fetchone()
+                if row is not None:
+                    status = DeployJobStatus.model_validate_json(row[0])
+                    message = "Failed: the gateway worker running it stopped"
+                    status.status = "failed"
+                    status.message = message
+                    status.updated_at = now
+                    event = DeployJobEvent(
+                        job_id=job_id,
+                        status="failed",
+                        message=message,
+                        elapsed_s=round(now - status.created_at, 2),
+                    )
+                    self._write(status, event)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def prune(self, retained: int = DEPLOY_JOBS_RETAINED):
+        """Drop all but the `retained` most recently updated finished jobs"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "DELETE FROM deploy_jobs WHERE finished AND job_id NOT IN ("
+                "SELECT job_id FROM deploy_jobs WHERE finished"
+                " ORDER BY updated_at DESC LIMIT ?)",
+                (retained,),
+            )
+            self._conn.execute(
+                "DELETE FROM deploy_job_events"
+                " WHERE job_id NOT IN (SELECT job_id FROM deploy_jobs)"
+            )
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class DeployJob:
+    def __init__(
+        self,
+        request: DeployRequestInner,
+        user_email: str,
+        store: DeployJobStore | None = None,
+    ):
+        now = time.time()
+        self.request = request
+        self.store = store
+        self.status = DeployJobStatus(
+            job_id=uuid.uuid4().hex,
+            user_email=user_email,
+            agent_name=request.agent_name,
+            status="queued",
+            created_at=now,
+            updated_at=now,
+        )
+        self.events: list[DeployJobEvent] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status.status in FINISHED_STATUSES
+
+    def update(self, status: str | None = None, message: str = "", **fields):
+        """Change job state and wake up progress subscribers"""
+        if status:
+            self.status.status = status
+        if message:
+            self.status.message = message
+        for name, value in fields.items():
+            setattr(self.status, name, value)
+        self.status.updated_at = time.time()
+        event = DeployJobEvent(
+            job_id=self.status.job_id,
+            status=self.status.status,
+            message=message,
+            elapsed_s=round(self.status.updated_at - self.status.created_at, 2),
+        )
+        self.events.append(event)
+        if self.store is not None:
+            try:
+                self.store.save(self.status, event)
+            except sqlite3.Error as e:
+                # followers on this worker still see it, don't fail the deploy
+                logger.warning(f"Saving deploy job {self.status.job_id} failed: {e}")
+        asyncio.create_task(self._notify())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[DeployJobEvent]:
+        """Yield every job event, past and future, until the job finishes"""
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+            async with self._changed:
+                if index == len(self.events) and not self.finished:
+                    await self._changed.wait()
+
+    async def wait(self) -> DeployJobStatus:
+        """Wait until the job has finished and return its final status"""
+        async for _ in self.follow():
+            pass
+        return self.status
+
+
+class StoredDeployJob:
+    """Read-only view of a job running on another gateway worker; fails the
+    job once that worker stops sending heartbeats"""
+
+    def __init__(
+        self,
+        status: DeployJobStatus,
+        store: DeployJobStore,
+        poll_interval: float = DEPLOY_JOBS_POLL_INTERVAL,
+        stale_after: float = DEPLOY_JOBS_STALE_SECONDS,
+    ):
+        self.status = status
+        self.store = store
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+
+    async def follow(self) -> AsyncIterator[DeployJobEvent]:
+        """Yield every job event, past and future, until the job finishes"""
+        seq = 0
+        while True:
+            for seq, event in self.store.events(self.status.job_id, after=seq):
+                yield event
+                if event.status in FINISHED_STATUSES:
+                    return
+            await asyncio.sleep(self.poll_interval)
+            self.store.fail_if_stale(self.status.job_id, self.stale_after)
+            status = self.store.get(self.status.job_id)
+            if status is None:
+                # pruned, or the database was reset
+                return
+            self.status = status
+
+
+class DeployJobManager:
+    """Queue of deployments driven by background workers.
+
+    `/deploy` only enqueues a job; the workers await the long-running Cloud
+    Run operation so the gateway event loop is never blocked by a rollout.
+    A job runs on the uvicorn worker that accepted it, but its status and
+    events go to a DeployJobStore, so any worker can report on it; a
+    heartbeat tells the others that its worker is still alive.
+    """
+
+    def __init__(
+        self,
+        runner: DeployRunner,
+        workers: int = DEPLOY_WORKERS,
+        store: DeployJobStore | None = None,
+        heartbeat_interval: float = DEPLOY_JOBS_HEARTBEAT_INTERVAL,
+        stale_after: float = DEPLOY_JOBS_STALE_SECONDS,
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.store = DeployJobStore() if store is None else store
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.jobs: dict[str, DeployJob] = {}
+        self._queue: asyncio.Queue[DeployJob] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self.store.open()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self.store.close()
+
+    def submit(self, request: DeployRequestInner, user_email: str) -> DeployJob:
+        job = DeployJob(request, user_email, store=self.store)
+        self.jobs[job.status.job_id] = job
+        job.update(message="Queued")
+        self._prune()
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> DeployJob | StoredDeployJob | None:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        # submitted to another worker
+        self.store.fail_if_stale(job_id, self.stale_after)
+        status = self.store.get(job_id)
+        if status is None:
+            return None
+        return StoredDeployJob(status, self.store, stale_after=self.stale_after)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - DEPLOY_JOBS_RETAINED)]:
+            del self.jobs[job_id]
+        self.store.prune(DEPLOY_JOBS_RETAINED)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            running = [job_id for job_id, job in self.jobs.items() if not job.finished]
+            try:
+                self.store.heartbeat(running)
+            except sqlite3.Error as e:
+                logger.warning(f"Deploy job heartbeat failed: {e}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: DeployJob):
+        job.update(status="running", message="Deployment started")
+        try:
+            response = await self.runner(
+                job.request,
+                job.status.user_email,
+                lambda message: job.update(message=message),
+            )
+        except Exception as e:
+            logger.exception(f"Deploy job {job.status.job_id} crashed")
+            job.update(status="failed", message=f"Failed: {str(e)}")
+            return
+
+        if response.status == "Deployed":
+            job.update(
+                status="succeeded",
+                message=response.status,
+                unique_service_name=response.unique_service_name,
+                url=response.url,
+            )
+        else:
+            job.update(status="failed", message=response.status)
@@ -0,0 +1,126 @@
+import codecs
+import json
+import re
+
+from models import AgentAnswerPart
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATOR = re.compile(r"[ \t\n\r]*,?[ \t\n\r]*")
+
+# ADK serializes events by alias (camelCase), accept snake_case too
+_PART_KINDS = (
+    ("functionCall", "function_call", "function_call"),
+    ("functionResponse", "function_response", "function_response"),
+    ("executableCode", "executable_code", "executable_code"),
+    ("codeExecutionResult", "code_execution_result", "code_execution_result"),
+    ("inlineData", "inline_data", "file"),
+    ("fileData", "file_data", "file"),
+)
+
+
+class EventArrayDecoder:
+    """Incremental decoder for the JSON array of events returned by ADK /run.
+
+    Feed it body chunks as they arrive; every complete event object is
+    decoded on its own (with the C json scanner) and its text dropped from
+    the buffer, so the whole document is never held or parsed at once. An
+    event that is still incomplete is only retried once its pending text has
+    doubled, which keeps decoding linear for very large events.
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._started = False
+        self._done = False
+        self._retry_at = 0  # pending length needed before the next attempt
+
+    def feed(self, chunk: bytes | str) -> list[dict]:
+        """Consume a chunk and return the events completed by it"""
+        if isinstance(chunk, bytes):
+            chunk = self._utf8.decode(chunk)
+        if not chunk or self._done:
+            return []
+        self._buffer += chunk
+        if len(self._buffer) < self._retry_at:
+            return []
+        return self._decode(final=False)
+
+    def close(self) -> list[dict]:
+        """Flush the decoder, failing if the array was not terminated"""
+        self._buffer += self._utf8.decode(b"", final=True)
+        events = [] if self._done else self._decode(final=True)
+        if not self._done:
+            raise ValueError("Truncated JSON array of events")
+        return events
+
+    def _decode(self, final: bool) -> list[dict]:
+        events: list[dict] = []
+        buffer = self._buffer
+        pos = 0
+        self._retry_at = 0
+
+        if not self._started:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                self._buffer = ""
+                return events
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of events")
+            self._started = True
+            pos += 1
+
+        while True:
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            try:
+                event, pos = self._json.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # incomplete event, wait until twice as much text is pending
+                self._retry_at = 2 * (len(buffer) - pos)
+                break
+            events.append(event)
+
+        self._buffer = buffer[pos:]
+        return events
+
+
+def parse_part(agent_name: str, part: dict) -> AgentAnswerPart | None:
+    """Convert one content part into an AgentAnswerPart"""
+    if "text" in part:
+        kind = "thought" if part.get("thought") else "text"
+        return AgentAnswerPart(agent_name=agent_name, kind=kind, text=part["text"])
+
+    for camel, snake, kind in _PART_KINDS:
+        data = part.get(camel, part.get(snake))
+        if data is None:
+            continue
+        if kind == "file":
+            # don't forward inline bytes, only describe the file
+            data = {k: v for k, v in data.items() if k != "data"}
+        return AgentAnswerPart(agent_name=agent_name, kind=kind, data=data)
+    return None
+
+
+def parse_event(event: dict) -> list[AgentAnswerPart]:
+    """Extract answer parts of every kind from a single ADK event"""
+    agent_name = event.get("author", "")
+    content = event.get("content") or {}
+    if agent_name == "user":
+        return []
+    answer_parts = []
+    for part in content.get("parts") or []:
+        answer_part = parse_part(agent_name, part)
+        if answer_part is not None:
+            answer_parts.append(answer_part)
+    return answer_parts
+
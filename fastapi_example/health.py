@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+
+from models import AgentHealth
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between probes of every registered agent url, 0 = no sweep: a
+# sweep keeps scaled-to-zero services awake, real queries are checks enough
+HEALTH_PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", "0"))
+# Seconds between probes of an agent url that is down, until it answers
+HEALTH_RECOVERY_INTERVAL = float(os.environ.get("HEALTH_RECOVERY_INTERVAL", "30"))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", "10"))
+# Samples kept per agent for percentiles and error rate
+HEALTH_WINDOW = int(os.environ.get("HEALTH_WINDOW", "120"))
+# Consecutive failed calls or probes before an agent is reported down
+HEALTH_FAILURE_THRESHOLD = int(os.environ.get("HEALTH_FAILURE_THRESHOLD", "3"))
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RollingLatency:
+    """Last `window` samples of latency (ms) and success"""
+
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self._samples: deque[tuple[float, bool]] = deque(maxlen=window)
+
+    def record(self, latency_ms: float, ok: bool = True):
+        self._samples.append((latency_ms, ok))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentiles(self, *qs: float) -> list[float | None]:
+        values = sorted(latency for latency, ok in self._samples if ok)
+        if not values:
+            return [None for _ in qs]
+        return [round(percentile(values, q), 2) for q in qs]
+
+
+class AgentState:
+    def __init__(self, window: int):
+        self.latency = RollingLatency(window)
+        self.consecutive_failures = 0
+        self.last_checked: float | None = None
+        self.last_error: str | None = None
+
+
+Probe = Callable[[str], Awaitable[None]]
+FailureCheck = Callable[[BaseException], bool]
+TargetLister = Callable[[], list[tuple[str, str, str]]]
+
+
+class AgentHealthMonitor:
+    """Health of every agent url, learned from the gateway's own calls.
+
+    Real queries report their outcome through `track`; only an url that
+    went down is probed, every `recovery_interval` until it answers again.
+    A sweep probing every registered url each `interval` is opt-in.
+
+    `list_targets` returns the registry rows (user_email, agent_name,
+    agent_url), `probe` raises when an agent url is unhealthy and
+    `is_failure` tells which errors of a tracked call are the agent's fault.
+    """
+
+    def __init__(
+        self,
+        list_targets: TargetLister,
+        probe: Probe,
+        interval: float = HEALTH_PROBE_INTERVAL,
+        timeout: float = HEALTH_PROBE_TIMEOUT,
+        window: int = HEALTH_WINDOW,
+        failure_threshold: int = HEALTH_FAILURE_THRESHOLD,
+        recovery_interval: float = HEALTH_RECOVERY_INTERVAL,
+        is_failure: FailureCheck = lambda e: isinstance(e, Exception),
+    ):
+        self.list_targets = list_targets
+        self.probe = probe
+        self.is_failure = is_failure
+        self.interval = interval
+        self.timeout = timeout
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.recovery_interval = recovery_interval
+        self._states: dict[str, AgentState] = {}
+        self._task: asyncio.Task | None = None
+        self._recoveries: dict[str, asyncio.Task] = {}
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        tasks = list(self._recoveries.values())
+        if self._task:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception:
+                logger.exception("Agent health check round failed")
+            await asyncio.sleep(self.interval)
+
+    def _sync_targets(self) -> dict[str, set[str]]:
+        """Registered agent urls and the agent names behind each one"""
+        agent_names: dict[str, set[str]] = {}
+        for _, agent_name, agent_url in self.list_targets():
+            if agent_url.startswith(("http://", "https://")):
+                agent_names.setdefault(agent_url, set()).add(agent_name)
+        # forget agents that left the registry
+        for agent_url in set(self._states) - set(agent_names):
+            del self._states[agent_url]
+        return agent_names
+
+    async def check_all(self):
+        agent_urls = self._sync_targets()
+        await asyncio.gather(*(self.check(agent_url) for agent_url in agent_urls))
+
+    async def check(self, agent_url: str):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.probe(agent_url), timeout=self.timeout)
+        except Exception as e:
+            self.record(agent_url, (time.perf_counter() - start) * 1000, error=e)
+        else:
+            self.record(agent_url, (time.perf_counter() - start) * 1000)
+
+    @contextmanager
+    def track(self, agent_url: str, sample_latency: bool = True):
+        """Count one real call to the agent url as a health check;
+        errors `is_failure` rejects are not counted either way"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if self.is_failure(e):
+                self.record(agent_url, (time.perf_counter() - start) * 1000, error=e)
+            raise
+        else:
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.record(agent_url, latency_ms if sample_latency else None)
+
+    def record(
+        self,
+        agent_url: str,
+        latency_ms: float | None,
+        error: BaseException | None = None,
+    ):
+        """One outcome; latency_ms None counts it without a latency sample"""
+        state = self._states.setdefault(agent_url, AgentState(self.window))
+        if latency_ms is not None or error is not None:
+            state.latency.record(latency_ms or 0.0, ok=error is None)
+        state.last_checked = time.time()
+        if error is None:
+            state.consecutive_failures = 0
+            state.last_error = None
+        else:
+            state.consecutive_failures += 1
+            state.last_error = str(error) or type(error).__name__
+            if self.is_down(agent_url):
+                self._start_recovery(agent_url)
+
+    def _start_recovery(self, agent_url: str):
+        if agent_url in self._recoveries or self.recovery_interval <= 0:
+            return
+        self._recoveries[agent_url] = asyncio.create_task(
+            self._probe_until_up(agent_url)
+        )
+
+    async def _probe_until_up(self, agent_url: str):
+        try:
+            while self.is_down(agent_url):
+                await asyncio.sleep(self.recovery_interval)
+                await self.check(agent_url)
+        finally:
+            self._recoveries.pop(agent_url, None)
+
+    def is_down(self, agent_url: str) -> bool:
+        state = self._states.get(agent_url)
+        return (
+            state is not None
+            and state.consecutive_failures >= self.failure_threshold
+        )
+
+    def snapshot(self) -> list[AgentHealth]:
+        result = []
+        for agent_url, agent_names in self._sync_targets().items():
+            state = self._states.get(agent_url)
+            if state is None:
+                # no call or probe has reached it yet
+                result.append(
+                    AgentHealth(
+                        agent_url=agent_url,
+                        agent_names=sorted(agent_names),
+                        status="unknown",
+                        samples=0,
+                        error_rate=0.0,
+                    )
+                )
+                continue
+            p50, p95, p99 = state.latency.percentiles(0.5, 0.95, 0.99)
+            result.append(
+                AgentHealth(
+                    agent_url=agent_url,
+                    agent_names=sorted(agent_names),
+                    status="down" if self.is_down(agent_url) else "up",
+                    samples=len(state.latency),
+                    error_rate=round(state.latency.error_rate(), 4),
+                    p50_ms=p50,
+                    p95_ms=p95,
+                    p99_ms=p99,
+                    consecutive_failures=state.consecutive_failures,
+                    last_checked=state.last_checked,
+                    last_error=state.last_error,
+                )
+            )
+        return result
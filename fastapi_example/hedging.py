@@ -0,0 +1,168 @@
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from cache import parse_agent_map
+from health import RollingLatency
+from metrics import HEDGED_QUERIES
+from models import QueryRequest
+
+
+# Opt-in per read-only agent, "agent=percentile,...", e.g. "rag=95": a second
+# /run goes out once the first has taken longer than that latency percentile
+HEDGE_AGENTS = os.environ.get("HEDGE_AGENTS", "")
+# Extra /run calls allowed as a fraction of hedge-eligible queries, with a
+# burst of up to HEDGE_BUDGET_BURST hedges after a quiet period
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BUDGET_BURST = float(os.environ.get("HEDGE_BUDGET_BURST", "10"))
+# Latency samples per agent kept, and needed before hedging starts
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "500"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "50"))
+
+
+T = TypeVar("T")
+
+
+class HedgeBudget:
+    """Token bucket filled by queries: each adds `ratio` tokens, a hedge
+    takes one, so hedges stay under `ratio` of the traffic"""
+
+    def __init__(
+        self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST
+    ):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Hedger:
+    """Hedged upstream calls for read-only agents.
+
+    `run` starts the primary call; if it hasn't finished after the agent's
+    observed latency percentile and the agent's budget allows, it starts a
+    backup call too. The first successful result wins and the other call is
+    cancelled. Only session-less queries are hedged: the backup runs in a
+    fresh session, which is only equivalent when there's no history.
+    """
+
+    def __init__(
+        self,
+        percentiles: dict[str, float] | None = None,
+        budget_ratio: float = HEDGE_BUDGET_RATIO,
+        budget_burst: float = HEDGE_BUDGET_BURST,
+        window: int = HEDGE_WINDOW,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ):
+        self.percentiles = (
+            parse_agent_map(HEDGE_AGENTS) if percentiles is None else percentiles
+        )
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: dict[str, RollingLatency] = {}
+        self._budgets: dict[str, HedgeBudget] = {}
+
+    def enabled(self, request: QueryRequest) -> bool:
+        return (
+            not request.current_session_id
+            and request.auth.agent_name in self.percentiles
+        )
+
+    def latency(self, agent_name: str) -> RollingLatency:
+        latency = self._latencies.get(agent_name)
+        if latency is None:
+            latency = self._latencies[agent_name] = RollingLatency(self.window)
+        return latency
+
+    def budget(self, agent_name: str) -> HedgeBudget:
+        budget = self._budgets.get(agent_name)
+        if budget is None:
+            budget = self._budgets[agent_name] = HedgeBudget(
+                self.budget_ratio, self.budget_burst
+            )
+        return budget
+
+    def delay(self, agent_name: str) -> float | None:
+        """Seconds to wait for the primary call before hedging, None if unknown"""
+        latency = self.latency(agent_name)
+        if len(latency) < self.min_samples:
+            return None
+        (threshold_ms,) = latency.percentiles(self.percentiles[agent_name] / 100)
+        return None if threshold_ms is None else threshold_ms / 1000
+
+    async def run(
+        self,
+        agent_name: str,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+    ) -> T:
+        budget = self.budget(agent_name)
+        budget.deposit()
+        delay = self.delay(agent_name)
+        start = time.perf_counter()
+        primary_task = asyncio.create_task(primary())
+        tasks = {primary_task}
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+            if primary_task.done() or delay is None:
+                result = await primary_task
+                self._record(agent_name, start)
+                return result
+            if not budget.withdraw():
+                HEDGED_QUERIES.inc(agent=agent_name, outcome="over_budget")
+                result = await primary_task
+                self._record(agent_name, start)
+                return result
+
+            backup_task = asyncio.create_task(backup())
+            tasks.add(backup_task)
+            first_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    winner = "primary" if task is primary_task else "backup"
+                    HEDGED_QUERIES.inc(agent=agent_name, outcome=f"{winner}_won")
+                    # a lost primary still took at least this long, keep the
+                    # sample so the tail doesn't vanish from the percentile
+                    self._record(agent_name, start)
+                    return task.result()
+            HEDGED_QUERIES.inc(agent=agent_name, outcome="both_failed")
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _record(self, agent_name: str, start: float):
+        self.latency(agent_name).record((time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> dict[str, dict]:
+        snapshot = {}
+        for agent_name, percentile in self.percentiles.items():
+            delay = self.delay(agent_name)
+            snapshot[agent_name] = {
+                "percentile": percentile,
+                "samples": len(self.latency(agent_name)),
+                "hedge_after_ms": None if delay is None else round(delay * 1000, 1),
+                "budget_tokens": round(self.budget(agent_name).tokens, 2),
+            }
+        return snapshot
@@ -1,30 +1,95 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from collections.abc import AsyncIterator
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from google.api_core.exceptions import NotFound
 from google.cloud import run_v2
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+import asyncio
 import logging
+import math
+import os
+import uuid
 import json
 import hashlib
 import time
 import httpx
-import google.oauth2.id_token
-from google.auth.transport.requests import Request
+from pydantic import ValidationError
 
 from models import (
     DeployRequest,
     DeployRequestInner,
     DeployResponse,
+    DeployJobStatus,
+    DeployBatchRequest,
+    DeployBatchResponse,
+    AgentHealth,
+    AgentReplicaRequest,
+    WarmupRequest,
+    WarmupResponse,
     TestConnectionRequest,
     TestConnectionResponse,
     QueryRequest,
     QueryResponse,
+    BatchQueryRequest,
+    BatchQueryResult,
     RunSSEBody,
     NewMessage,
     MessagePart,
-    AgentAnswerPart,
 )
 
 
 from mock_db import DB_ENV_VARS, DB
+from registry import AgentRegistry
+from upstream import UpstreamClientPool
+from auth import IdTokenProvider, get_token_fetcher
+from deploy_jobs import DeployJobManager, ProgressReporter
+from ws import ConversationMux
+from event_parser import EventArrayDecoder, parse_event
+from sessions import KnownSessionCache, SessionPool
+from cache import CACHE_BYPASS_HEADER, ResponseCache
+from singleflight import SingleFlight
+from admission import (
+    PRIORITIES,
+    PRIORITY_HEADER,
+    AdmissionController,
+    AdmissionRejected,
+)
+from health import AgentHealthMonitor
+from routing import ReplicaRouter, is_replica_failure
+from hedging import Hedger
+from ratelimit import RateLimited, RateLimiter
+from warmup import WarmupTracker
+from responses import ClosingStreamingResponse, CompressionMiddleware, ORJSONResponse
+from tracing import (
+    FASTAPI_TRACES_REQUESTS,
+    TracingMiddleware,
+    configure_tracing,
+    mark_error,
+    tracer,
+)
+from rollout import (
+    CONFIG_HASH_ANNOTATION,
+    config_fingerprint,
+    pin_image,
+    resolve_image_digest,
+    serves_latest,
+    stable_service_name,
+    traffic_split,
+)
+from resilience import CircuitOpenError, UpstreamError, UpstreamGuard
+from metrics import (
+    REGISTRY as METRICS,
+    STAGE_DURATION,
+    UPSTREAM_IN_FLIGHT,
+    UPSTREAM_REQUEST_BYTES,
+    UPSTREAM_LATENCY,
+    UPSTREAM_RESPONSE_BYTES,
+    MetricsMiddleware,
+    time_stage,
+)
 
 
 # Configure logging
@@ -36,7 +101,87 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
+# Agent urls and env vars, shared by all workers (mock_db seeds it);
+# AGENT_REGISTRY_PATH, opened in lifespan
+registry = AgentRegistry(seed_urls=DB, seed_env_vars=DB_ENV_VARS)
+# Shared keep-alive clients to agent services, one per origin
+upstream_pool = UpstreamClientPool()
+# Cached ID tokens per agent url (audience)
+token_provider = IdTokenProvider(fetcher=get_token_fetcher())
+# Opt-in cache of answers from read-only agents (RESPONSE_CACHE_AGENTS)
+response_cache = ResponseCache()
+# Circuit breakers and adaptive timeouts per agent url
+upstream_guard = UpstreamGuard()
+# Identical concurrent upstream calls share one request
+upstream_flights = SingleFlight()
+# Bounded per agent upstream concurrency with a priority wait queue
+admission = AdmissionController()
+# Opt-in hedged /run calls for read-only agents (HEDGE_AGENTS)
+hedger = Hedger()
+# Per user and per (user, agent) token buckets, shared by all workers;
+# RATE_LIMIT_PATH, opened in lifespan
+rate_limiter = RateLimiter()
+
+
+def query_flight_key(request: QueryRequest):
+    # only session-less queries are safe to share, a session has history
+    if request.current_session_id:
+        return None
+    return (
+        "query",
+        request.auth.user_email,
+        request.auth.agent_name,
+        request.query,
+        request.timeout,
+    )
+
+
+def session_flight_key(user_email: str, agent_name: str, session_id: str):
+    return ("session", user_email, agent_name, session_id)
+
+
+# Single-flight key per upstream call, set an entry to (lambda *_: None) to
+# disable sharing for it
+SINGLE_FLIGHT_KEYS = {
+    "query": query_flight_key,
+    "ensure_session": session_flight_key,
+}
+
+
+# Default and max per-agent concurrency of /query/batch
+BATCH_AGENT_CONCURRENCY = int(os.environ.get("BATCH_AGENT_CONCURRENCY", "8"))
+BATCH_AGENT_CONCURRENCY_MAX = int(os.environ.get("BATCH_AGENT_CONCURRENCY_MAX", "64"))
+# Probed by the health monitor; exists on every ADK api server
+HEALTH_PROBE_PATH = os.environ.get("HEALTH_PROBE_PATH", "/list-apps")
+# Upper bound for session create/lookup calls, adaptive timeouts go below it
+SESSION_TIMEOUT = float(os.environ.get("SESSION_TIMEOUT", "30"))
+# How often a running deploy job reports progress
+DEPLOY_PROGRESS_INTERVAL = float(os.environ.get("DEPLOY_PROGRESS_INTERVAL", "10"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracer_provider = configure_tracing()
+    registry.open()
+    rate_limiter.open()
+    deploy_queue.start()
+    health_monitor.start()
+    yield
+    await health_monitor.stop()
+    await replica_router.aclose()
+    await deploy_queue.stop()
+    if services_client is not None:
+        await services_client.transport.close()
+    await session_pool.aclose()
+    await token_provider.aclose()
+    await upstream_pool.aclose()
+    registry.close()
+    rate_limiter.close()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()  # flushes pending spans
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 app.add_middleware(
@@ -46,6 +191,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+if not FASTAPI_TRACES_REQUESTS:
+    app.add_middleware(TracingMiddleware)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the gateway metrics"""
+    return PlainTextResponse(
+        METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 def generate_service_name(basic_service_name: str) -> str:
@@ -55,74 +212,256 @@ def generate_service_name(basic_service_name: str) -> str:
 
 
 def get_env_vars_for_agent(agent_name: str) -> dict[str, str]:
-    # Placeholder function to get environment variables from a database
-    return DB_ENV_VARS.get(agent_name, {})
+    return registry.get_env_vars(agent_name)
+
+
+def get_deploy_request_inner(
+    agent_name: str, request: DeployRequest | DeployBatchRequest
+) -> DeployRequestInner:
+    overrides = request.model_dump(
+        include={
+            "min_instances",
+            "cpu_boost",
+            "concurrency",
+            "deploy_mode",
+            "traffic_steps",
+        },
+        exclude_none=True,
+    )
+    try:
+        return DeployRequestInner(
+            agent_name=agent_name,
+            env_vars=get_env_vars_for_agent(agent_name),
+            **overrides,
+        )
+    except ValidationError as e:
+        # no input: it would echo the deploy payload, env_vars (secrets) included
+        raise HTTPException(
+            status_code=422,
+            detail=e.errors(
+                include_url=False, include_context=False, include_input=False
+            ),
+        )
 
 
-@app.post("/deploy", response_model=DeployResponse)
+@app.post("/deploy", response_model=DeployJobStatus, status_code=202)
 async def deploy_endpoint(request: DeployRequest):
-    env_vars = get_env_vars_for_agent(request.agent_name)
+    """Enqueue a deployment and return its job id right away"""
+    deploy_request_inner = get_deploy_request_inner(request.agent_name, request)
 
-    deploy_request_inner = DeployRequestInner(
-        agent_name=request.agent_name, env_vars=env_vars
-    )
+    job = deploy_queue.submit(deploy_request_inner, user_email=request.user_email)
+    return job.status
+
+
+@app.post("/deploy/batch", response_model=DeployBatchResponse, status_code=202)
+async def deploy_batch_endpoint(request: DeployBatchRequest):
+    """Deploy several agents at once; the rollouts run concurrently.
+
+    With `wait` the response comes when every job has finished, so the
+    wall-clock time is that of the slowest deploy.
+    """
+    jobs = [
+        deploy_queue.submit(
+            get_deploy_request_inner(agent_name, request),
+            user_email=request.user_email,
+        )
+        for agent_name in request.agent_names
+    ]
+    if request.wait:
+        statuses = await asyncio.gather(*(job.wait() for job in jobs))
+        return DeployBatchResponse(jobs=list(statuses))
+    return DeployBatchResponse(jobs=[job.status for job in jobs])
+
+
+def get_deploy_job(job_id: str):
+    job = deploy_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown deploy job {job_id}")
+    return job
 
-    return await deploy_service(deploy_request_inner, user_email=request.user_email)
+
+@app.get("/deploy/{job_id}", response_model=DeployJobStatus)
+async def deploy_status(job_id: str):
+    return get_deploy_job(job_id).status
+
+
+@app.get("/deploy/{job_id}/events")
+async def deploy_events(job_id: str):
+    """Server-sent events with the progress of a deploy job"""
+    job = get_deploy_job(job_id)
+
+    async def event_stream():
+        async for event in job.follow():
+            yield sse_event(event.model_dump_json(), event=event.status)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
 def save_to_db(user_email: str, agent_name: str, agent_url: str):
-    # Placeholder function to save to a database
-    DB[(user_email, agent_name)] = agent_url
+    # other workers pick the change up through the registry's data_version
+    registry.save_agent_url(user_email, agent_name, agent_url)
+    # a new revision starts with an empty sessions.db
+    known_sessions.discard_url(agent_url)
+    session_pool.discard_url(agent_url)
     logger.info(f"Saved to DB: {agent_name} -> {agent_url}")
 
 
-async def deploy_service(request: DeployRequestInner, user_email: str):
+# One Cloud Run client (and gRPC channel) shared by every deploy job
+services_client: run_v2.ServicesAsyncClient | None = None
 
-    try:
-        client = run_v2.ServicesClient()
-        service = run_v2.Service()
-        service.template.containers = [
-            run_v2.Container(
-                image=request.image,
-                env=[
-                    run_v2.EnvVar(name=k, value=v) for k, v in request.env_vars.items()
-                ],
-                resources=run_v2.ResourceRequirements(
-                    limits={"memory": request.memory}
-                ),
-            )
-        ]
-        service.template.timeout = f"{request.timeout}s"
-
-        # no permission to set service account
-        # Configure service account
-        # if request.service_account:
-        #     service.template.service_account = request.service_account
-
-        # Configure VPC access if network and subnet are provided
-        if request.network and request.subnet:
-            service.template.vpc_access = run_v2.VpcAccess(
-                egress=run_v2.VpcAccess.VpcEgress.ALL_TRAFFIC,
-                network_interfaces=[
-                    run_v2.VpcAccess.NetworkInterface(
-                        network=request.network,
-                        subnetwork=request.subnet,
-                    )
-                ],
-            )
 
-        # service.ingress = run_v2.IngressTraffic.INGRESS_TRAFFIC_INTERNAL_ONLY
+def get_services_client() -> run_v2.ServicesAsyncClient:
+    # created lazily, the async client needs the running event loop
+    global services_client
+    if services_client is None:
+        services_client = run_v2.ServicesAsyncClient()
+    return services_client
 
-        parent = f"projects/{request.project_id}/locations/{request.region}"
 
-        # Deploy or update the service
-        operation = client.create_service(
-            parent=parent,
-            service=service,
-            service_id=generate_service_name(request.agent_name),
+def build_service(
+    request: DeployRequestInner, image: str, fingerprint: str = ""
+) -> run_v2.Service:
+    service = run_v2.Service()
+    service.template.containers = [
+        run_v2.Container(
+            image=image,
+            env=[run_v2.EnvVar(name=k, value=v) for k, v in request.env_vars.items()],
+            resources=run_v2.ResourceRequirements(
+                limits={"memory": request.memory},
+                startup_cpu_boost=request.cpu_boost,
+            ),
+        )
+    ]
+    service.template.timeout = f"{request.timeout}s"
+
+    # Cold start mitigation
+    service.template.scaling = run_v2.RevisionScaling(
+        min_instance_count=request.min_instances
+    )
+    if request.concurrency:
+        service.template.max_instance_request_concurrency = request.concurrency
+
+    # no permission to set service account
+    # Configure service account
+    # if request.service_account:
+    #     service.template.service_account = request.service_account
+
+    # Configure VPC access if network and subnet are provided
+    if request.network and request.subnet:
+        service.template.vpc_access = run_v2.VpcAccess(
+            egress=run_v2.VpcAccess.VpcEgress.ALL_TRAFFIC,
+            network_interfaces=[
+                run_v2.VpcAccess.NetworkInterface(
+                    network=request.network,
+                    subnetwork=request.subnet,
+                )
+            ],
         )
 
-        response = operation.result()
+    # service.ingress = run_v2.IngressTraffic.INGRESS_TRAFFIC_INTERNAL_ONLY
+
+    if fingerprint:
+        service.annotations = {CONFIG_HASH_ANNOTATION: fingerprint}
+    return service
+
+
+async def wait_for_operation(operation, service_id: str, report: ProgressReporter):
+    """Await a long-running Cloud Run operation, reporting progress meanwhile"""
+    result = asyncio.ensure_future(operation.result())
+    started = time.time()
+    while True:
+        done, _ = await asyncio.wait({result}, timeout=DEPLOY_PROGRESS_INTERVAL)
+        if done:
+            break
+        report(f"Rolling out {service_id} ({int(time.time() - started)}s)")
+    return result.result()
+
+
+async def create_new_service(
+    request: DeployRequestInner, parent: str, report: ProgressReporter
+) -> run_v2.Service:
+    client = get_services_client()
+    service_id = generate_service_name(request.agent_name)
+    operation = await client.create_service(
+        parent=parent,
+        service=build_service(request, request.image),
+        service_id=service_id,
+    )
+    report(f"Creating service {service_id} ({operation.operation.name})")
+    return await wait_for_operation(operation, service_id, report)
+
+
+async def update_service_in_place(
+    request: DeployRequestInner,
+    parent: str,
+    user_email: str,
+    report: ProgressReporter,
+) -> run_v2.Service:
+    """Roll a new revision onto the user's service for this agent.
+
+    The image is pinned by digest and the whole revision config is hashed
+    into a service annotation, so a redeploy of the same image and env vars
+    is a no-op. Traffic moves to the new revision in `traffic_steps`.
+    """
+    client = get_services_client()
+    service_id = stable_service_name(request.agent_name, user_email)
+    name = f"{parent}/services/{service_id}"
+
+    digest = await resolve_image_digest(upstream_pool, request.image)
+    image = pin_image(request.image, digest)
+    fingerprint = config_fingerprint(request, image)
+    service = build_service(request, image, fingerprint)
+
+    try:
+        existing = await client.get_service(name=name)
+    except NotFound:
+        operation = await client.create_service(
+            parent=parent, service=service, service_id=service_id
+        )
+        report(f"Creating service {service_id} ({operation.operation.name})")
+        return await wait_for_operation(operation, service_id, report)
+
+    # without a digest the tag may have moved, so it always rolls out
+    if (
+        digest
+        and existing.annotations.get(CONFIG_HASH_ANNOTATION) == fingerprint
+        and serves_latest(existing)
+    ):
+        report(f"{service_id} already runs {image}, skipping rollout")
+        return existing
+
+    previous = existing.latest_ready_revision or None
+    steps = request.traffic_steps if previous else [100]
+    service.name = name
+    service.traffic = traffic_split(steps[0], previous)
+    operation = await client.update_service(service=service)
+    report(f"Updating service {service_id} ({operation.operation.name})")
+    response = await wait_for_operation(operation, service_id, report)
+
+    for percent in steps[1:]:
+        await asyncio.sleep(request.traffic_step_interval)
+        report(f"Shifting {percent}% of {service_id} traffic to the new revision")
+        response.traffic = traffic_split(percent, previous)
+        operation = await client.update_service(service=response)
+        response = await wait_for_operation(operation, service_id, report)
+    return response
+
+
+async def deploy_service(
+    request: DeployRequestInner,
+    user_email: str,
+    report: ProgressReporter = lambda message: None,
+) -> DeployResponse:
+
+    try:
+        parent = f"projects/{request.project_id}/locations/{request.region}"
+
+        if request.deploy_mode == "create":
+            response = await create_new_service(request, parent, report)
+        else:
+            response = await update_service_in_place(
+                request, parent, user_email, report
+            )
 
         save_to_db(user_email, request.agent_name, response.uri)
 
@@ -135,24 +474,174 @@ async def deploy_service(request: DeployRequestInner, user_email: str):
         )
 
 
+# Background deploy workers and their job store (DEPLOY_JOBS_PATH), started
+# in lifespan
+deploy_queue = DeployJobManager(runner=deploy_service)
+
+
+async def probe_agent(agent_url: str):
+    """Health probe for down agent urls, ejected replicas and warm-up"""
+    id_token = await authorize_url(agent_url)
+    client = upstream_pool.get(agent_url)
+    response = await client.get(
+        f"{agent_url.rstrip('/')}{HEALTH_PROBE_PATH}",
+        headers={"Authorization": f"Bearer {id_token}"},
+    )
+    # an answered probe keeps the instance up just like a real call does
+    warmup_tracker.touch(agent_url)
+    if response.status_code >= 500:
+        raise RuntimeError(f"{HEALTH_PROBE_PATH} returned {response.status_code}")
+
+
+# Tells cold (idle for a while) agent services from warm ones
+warmup_tracker = WarmupTracker()
+warmup_tasks: set[asyncio.Task] = set()
+
+
+def is_agent_failure(exc: BaseException) -> bool:
+    """Replica failures except calls an open circuit never sent"""
+    return is_replica_failure(exc) and not isinstance(exc, CircuitOpenError)
+
+
+# Health of every agent url from real calls, probes the ones that are down
+health_monitor = AgentHealthMonitor(
+    list_targets=registry.list_agent_urls,
+    probe=probe_agent,
+    is_failure=is_agent_failure,
+)
+
+
+@app.get("/agents/health", response_model=list[AgentHealth])
+async def agents_health():
+    """Rolling call latency and error rate of every registered agent"""
+    return health_monitor.snapshot()
+
+
+# Spreads an agent's calls over its replica urls, ejects failing ones
+replica_router = ReplicaRouter(probe=probe_agent)
+
+
+@contextmanager
+def track_replica(agent_url: str, sample_latency: bool = True):
+    """Feed one real call's outcome to the replica router and health monitor"""
+    with (
+        replica_router.track(agent_url, sample_latency),
+        health_monitor.track(agent_url, sample_latency),
+    ):
+        yield
+
+
+def choose_replica(agent_urls: list[str]) -> str:
+    """Replica for a new session: health-checked ones first, then p2c"""
+    if not agent_urls:
+        raise LookupError("Agent is not registered")
+    healthy = [url for url in agent_urls if not health_monitor.is_down(url)]
+    return replica_router.pick(healthy or agent_urls)
+
+
+@app.get("/agents/replicas")
+async def agents_replicas():
+    """Latency average, in-flight calls and ejection state of every replica"""
+    return replica_router.snapshot()
+
+
+@app.post("/agents/replicas", status_code=204)
+async def add_agent_replica(request: AgentReplicaRequest):
+    registry.add_agent_replica(
+        request.user_email, request.agent_name, request.agent_url
+    )
+
+
+@app.delete("/agents/replicas", status_code=204)
+async def remove_agent_replica(request: AgentReplicaRequest):
+    registry.remove_agent_replica(
+        request.user_email, request.agent_name, request.agent_url
+    )
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return ORJSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return ORJSONResponse(
+        status_code=429, content={"detail": str(exc)}, headers=exc.result.headers()
+    )
+
+
+@app.get("/agents/admission")
+async def agents_admission():
+    """Upstream slots in use and queries waiting, per agent"""
+    return admission.snapshot()
+
+
+@app.get("/agents/circuits")
+async def agents_circuits():
+    """Circuit breaker state per agent url"""
+    return upstream_guard.snapshot()
+
+
+async def warm_up_agent(agent_name: str, agent_url: str):
+    """Wake the agent service up and get a session and token ready for it"""
+    start_label = warmup_tracker.start_label(agent_url)
+    start = time.perf_counter()
+    try:
+        await probe_agent(agent_url)
+    except Exception as e:
+        logger.warning(f"Warm-up of {agent_name} at {agent_url} failed: {e}")
+        return
+    # the probe woke the instance up, the user's first query finds it warm
+    UPSTREAM_LATENCY.observe(
+        time.perf_counter() - start, agent=agent_name, start=f"warmup_{start_label}"
+    )
+    session_pool.refill(agent_url, agent_name, "user")
+
+
+@app.post("/warmup", response_model=WarmupResponse, status_code=202)
+async def warmup(request: WarmupRequest):
+    """Warm up the agents a user is about to use, e.g. right after login.
+
+    Pings each agent service so a scaled-to-zero instance starts now rather
+    than on the first query, and pre-provisions sessions for it.
+    """
+    targets = [
+        (agent_name, agent_url)
+        for user_email, agent_name, agent_url in registry.list_agent_urls()
+        if user_email == request.user_email
+        and agent_url.startswith(("http://", "https://"))
+        and (request.agent_names is None or agent_name in request.agent_names)
+    ]
+    for agent_name, agent_url in targets:
+        task = asyncio.create_task(warm_up_agent(agent_name, agent_url))
+        warmup_tasks.add(task)
+        task.add_done_callback(warmup_tasks.discard)
+    return WarmupResponse(scheduled=[agent_name for agent_name, _ in targets])
+
+
 @app.post("/test-connection", response_model=TestConnectionResponse)
 async def test_connection(request: TestConnectionRequest):
     """Test connection to an ADK agent service"""
     start_time = time.time()
 
     try:
-        async with httpx.AsyncClient(timeout=request.timeout) as client:
-            url = f"{request.agent_url.rstrip('/')}{request.endpoint}"
-            response = await client.get(url)
+        client = upstream_pool.get(request.agent_url)
+        url = f"{request.agent_url.rstrip('/')}{request.endpoint}"
+        response = await client.get(url, timeout=request.timeout)
 
-            response_time = (time.time() - start_time) * 1000
+        response_time = (time.time() - start_time) * 1000
 
-            return TestConnectionResponse(
-                status="success",
-                response_time_ms=round(response_time, 2),
-                status_code=response.status_code,
-                message=f"Connected successfully to {url}",
-            )
+        return TestConnectionResponse(
+            status="success",
+            response_time_ms=round(response_time, 2),
+            status_code=response.status_code,
+            message=f"Connected successfully to {url}",
+        )
     except httpx.TimeoutException:
         response_time = (time.time() - start_time) * 1000
         return TestConnectionResponse(
@@ -169,17 +658,20 @@ async def test_connection(request: TestConnectionRequest):
         )
 
 
-def authorize_url(agent_url: str) -> str:
+async def authorize_url(agent_url: str) -> str:
     """Authorize the request using Google ID token"""
-
-    auth_req = Request()
-    id_token = google.oauth2.id_token.fetch_id_token(auth_req, agent_url)
-    return id_token
+    with tracer.start_as_current_span("authorize"):
+        return await token_provider.get_token(agent_url)
 
 
 def call_db_for_agent_url(user_email: str, agent_name: str) -> str:
-    """Fetch agent URL from the mock database"""
-    return DB.get((user_email, agent_name), "")
+    """Fetch agent URL from the registry"""
+    return registry.get_agent_url(user_email, agent_name)
+
+
+def call_db_for_agent_urls(user_email: str, agent_name: str) -> list[str]:
+    """Fetch the URLs of all the agent's replicas from the registry"""
+    return registry.get_agent_urls(user_email, agent_name)
 
 
 def email_to_id(user_email):
@@ -187,31 +679,163 @@ def email_to_id(user_email):
 
 
 def generate_session_id():
-    return hashlib.sha256(str(time.time()).encode()).hexdigest()
+    # uuid4 keeps ids unique when the pool creates sessions concurrently
+    return hashlib.sha256(f"{time.time()}-{uuid.uuid4()}".encode()).hexdigest()
 
 
-# TODO: Check if session exists, and then create (get endpoint on agent side)
-async def create_session_for_user(user_email: str, agent_name: str) -> str:
-    """Create a unique session ID for the user-agent pair"""
-    agent_url = call_db_for_agent_url(user_email=user_email, agent_name=agent_name)
-    # user_id = email_to_id(user_email)
-    user_id = "user"
-    session_id = generate_session_id()
+def get_sessions_url(agent_url: str, agent_name: str, user_id: str) -> str:
+    return f"{agent_url.rstrip('/')}/apps/{agent_name}/users/{user_id}/sessions"
+
+
+def raise_for_upstream(response: httpx.Response, agent_url: str):
+    """Raise UpstreamError for an error status from an agent (body read)"""
+    if response.is_error:
+        if response.status_code in (401, 403):
+            # don't keep serving a token the agent rejected until its exp
+            token_provider.invalidate(agent_url)
+        raise UpstreamError(response.status_code, response.text[:500])
+
 
-    id_token = authorize_url(agent_url)
+async def post_session(
+    agent_url: str, agent_name: str, user_id: str, session_id: str | None = None
+) -> str:
+    """Create a session on the agent side and return its id"""
+    session_id = session_id or generate_session_id()
+
+    id_token = await authorize_url(agent_url)
     headers = {"Authorization": f"Bearer {id_token}"}
-    async with httpx.AsyncClient() as client:
+    client = upstream_pool.get(agent_url)
+
+    async def create(timeout: float):
         response = await client.post(
-            f"{agent_url}/apps/{agent_name}/users/{user_id}/sessions",
+            get_sessions_url(agent_url, agent_name, user_id),
             json={"session_id": session_id, "state": {}},
             headers=headers,
+            timeout=timeout,
         )
+        raise_for_upstream(response, agent_url)
 
+    await upstream_guard.call(agent_url, "session", SESSION_TIMEOUT, create)
     return session_id
 
 
+# Sessions that are known to exist, and ones created ahead of time
+known_sessions = KnownSessionCache()
+session_pool = SessionPool(creator=post_session)
+
+
+def is_lost_session(e: Exception) -> bool:
+    # sessions live in the agent container's sessions.db, which a restart,
+    # scale to zero or redeploy wipes; /run then answers 404
+    return isinstance(e, UpstreamError) and e.status_code == 404
+
+
+def forget_lost_session(
+    user_email: str, agent_name: str, session_id: str, agent_url: str
+):
+    """Stop handing out a session the agent no longer has, nor pooled ones
+    made by the same (gone) instance"""
+    known_sessions.discard(user_email, agent_name, session_id)
+    session_pool.discard_url(agent_url)
+
+
+async def create_session_for_user(
+    user_email: str, agent_name: str, agent_urls: list[str]
+) -> tuple[str, str]:
+    """Create a unique session ID for the user-agent pair on one replica"""
+    agent_url = choose_replica(agent_urls)
+    # user_id = email_to_id(user_email)
+    user_id = "user"
+
+    # a pre-provisioned session saves the create round trip
+    session_id = session_pool.take(agent_url, agent_name, user_id)
+    if session_id is None:
+        with track_replica(agent_url, sample_latency=False):
+            session_id = await post_session(agent_url, agent_name, user_id)
+
+    known_sessions.add(user_email, agent_name, session_id, agent_url)
+    return session_id, agent_url
+
+
+async def ensure_session(
+    user_email: str, agent_name: str, session_id: str, agent_urls: list[str]
+) -> str:
+    """Make sure the given session exists on a replica, return that replica"""
+    agent_url = known_sessions.get(user_email, agent_name, session_id)
+    if agent_url in agent_urls:
+        return agent_url
+
+    key = SINGLE_FLIGHT_KEYS["ensure_session"](user_email, agent_name, session_id)
+    return await upstream_flights.do(
+        key,
+        lambda: check_or_create_session(user_email, agent_name, session_id, agent_urls),
+    )
+
+
+async def session_exists(agent_url: str, agent_name: str, session_id: str) -> bool:
+    user_id = "user"
+    id_token = await authorize_url(agent_url)
+    headers = {"Authorization": f"Bearer {id_token}"}
+    client = upstream_pool.get(agent_url)
+
+    async def exists(timeout: float) -> bool:
+        response = await client.get(
+            f"{get_sessions_url(agent_url, agent_name, user_id)}/{session_id}",
+            headers=headers,
+            timeout=timeout,
+        )
+        if response.status_code == 404:
+            return False
+        raise_for_upstream(response, agent_url)
+        return True
+
+    with track_replica(agent_url, sample_latency=False):
+        return await upstream_guard.call(agent_url, "session", SESSION_TIMEOUT, exists)
+
+
+async def check_or_create_session(
+    user_email: str, agent_name: str, session_id: str, agent_urls: list[str]
+) -> str:
+    # sessions live on the replica that created them, look on each one
+    lookup_error = None
+    for agent_url in agent_urls:
+        try:
+            found = await session_exists(agent_url, agent_name, session_id)
+        except Exception as e:
+            lookup_error = lookup_error or e
+            continue
+        if found:
+            known_sessions.add(user_email, agent_name, session_id, agent_url)
+            return agent_url
+    if lookup_error is not None:
+        # it may be on the replica we couldn't ask, don't fork the conversation
+        raise lookup_error
+
+    agent_url = choose_replica(agent_urls)
+    with track_replica(agent_url, sample_latency=False):
+        await post_session(agent_url, agent_name, "user", session_id)
+    known_sessions.add(user_email, agent_name, session_id, agent_url)
+    return agent_url
+
+
+@tracer.start_as_current_span("session")
+async def get_session_for_query(
+    request: QueryRequest, agent_urls: list[str]
+) -> tuple[str, str]:
+    """Session to run the query in (the given one, or a fresh one) and the
+    replica holding it"""
+    user_email = request.auth.user_email
+    agent_name = request.auth.agent_name
+    if request.current_session_id:
+        agent_url = await ensure_session(
+            user_email, agent_name, request.current_session_id, agent_urls
+        )
+        return request.current_session_id, agent_url
+    return await create_session_for_user(user_email, agent_name, agent_urls)
+
+
 def get_runsse_body(
-    agent_name: str, user_id: str, session_id: str, query: str
+    agent_name: str, user_id: str, session_id: str, query: str, streaming: bool = False
 ) -> RunSSEBody:
 
     runsse_body = RunSSEBody(
@@ -222,64 +846,221 @@ def get_runsse_body(
             role="user",
             parts=[MessagePart(text=query)],
         ),
-        streaming=False,
+        streaming=streaming,
         stateDelta=None,
     )
     return runsse_body
 
 
-def parse_response(response_text: str) -> list[AgentAnswerPart]:
-    data = json.loads(response_text)
-    agent_answer_parts: list[AgentAnswerPart] = []
-    for part in data:
-        agent_name = part.get("author", "")
-        content = part.get("content", "")
-        if content.get("role") == "model":
-            parts = content.get("parts", [])
-            inside_part = parts[0]  # assuming single part (only that scenario)
-            if "text" in inside_part:
-                agent_text = inside_part["text"]
-                agent_answer_parts.append(
-                    AgentAnswerPart(agent_name=agent_name, text=agent_text)
-                )
-
-    return agent_answer_parts
+def sse_event(data: str, event: str | None = None) -> str:
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
 
 
 @app.post("/query", response_model=QueryResponse)
-async def query_agent(request: QueryRequest):
+async def query_agent(request: QueryRequest, http_request: Request, response: Response):
     """Run /query endpoint of an ADK agent"""
     user_email = request.auth.user_email
     agent_name = request.auth.agent_name
-    agent_url = call_db_for_agent_url(user_email=user_email, agent_name=agent_name)
+    # the cache key leaves the user out, so check they may ask this agent
+    # (deployed for them, within their rate limit) before answering from it
+    limit = await rate_limiter.check(user_email, agent_name)
+    if limit is not None:
+        response.headers.update(limit.headers())
+    registered = bool(call_db_for_agent_urls(user_email, agent_name))
 
-    try:
-        # Get ID token for authentication
-        url = f"{agent_url.rstrip('/')}/run"
-        # Get proper ID token with audience
+    if http_request.headers.get(CACHE_BYPASS_HEADER) == "1" or not registered:
+        response.headers["X-Cache"] = "BYPASS"
+    else:
+        cached = response_cache.lookup(request)
+        if cached is not None:
+            response.headers["X-Cache"] = "HIT"
+            return cached
+        response.headers["X-Cache"] = "MISS"
+
+    priority = http_request.headers.get(PRIORITY_HEADER, "interactive")
+    result = await run_query_shared(
+        request, priority=priority if priority in PRIORITIES else "interactive"
+    )
+    response_cache.store(request, result)
+    return result
+
+
+async def run_query_shared(
+    request: QueryRequest, endpoint: str = "/query", priority: str = "interactive"
+) -> QueryResponse:
+    """run_query, joining an identical query that is already in flight.
+
+    Only the call that actually goes upstream takes an admission slot;
+    AdmissionRejected is raised when the agent's queue is full.
+    """
+
+    async def admitted_run() -> QueryResponse:
+        async with admission.admit(request.auth.agent_name, priority):
+            return await run_query(request, endpoint)
+
+    key = SINGLE_FLIGHT_KEYS["query"](request)
+    result = await upstream_flights.do(key, admitted_run)
+    return result.model_copy(update={"query": request.query})
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/agents/hedging")
+async def agents_hedging():
+    """Hedge delay, samples and remaining budget of every hedged agent"""
+    return hedger.snapshot()
+
+
+async def run_on_replica(
+    request: QueryRequest, endpoint: str, agent_url: str, session_id: str
+) -> list:
+    """POST the query to one replica's /run and return the parsed answer"""
+    agent_name = request.auth.agent_name
+    # user_id = email_to_id(user_email)
+    user_id = "user"
+    # Get ID token for authentication
+    url = f"{agent_url.rstrip('/')}/run"
+    # session_id = "6c38fa03-9ca5-488f-b52d-d9bbb6173ade" # LOCAL
+    runsse_body = get_runsse_body(agent_name, user_id, session_id, request.query)
+    payload = runsse_body.model_dump_json().encode()
+    UPSTREAM_REQUEST_BYTES.inc(len(payload), agent=agent_name)
+
+    # Comment to test locally
+    with time_stage("authorize", endpoint, agent_name):
+        id_token = await authorize_url(agent_url)
+    headers = {
+        "Authorization": f"Bearer {id_token}",
+        "Content-Type": "application/json",
+    }
+    # Comment to test locally
+    client = upstream_pool.get(agent_url)
+    start_label = warmup_tracker.start_label(agent_url)
+    upstream_start = time.perf_counter()
+    parse_seconds = 0.0
+
+    @tracer.start_as_current_span("upstream.run", kind=SpanKind.CLIENT)
+    async def run(timeout: float) -> list:
+        nonlocal parse_seconds
+        span = trace.get_current_span()
+        span.set_attributes(
+            {"http.request.method": "POST", "url.full": url, "timeout_s": timeout}
+        )
+        async with client.stream(
+            "POST", url, headers=headers, content=payload, timeout=timeout
+        ) as response:  # delete headers to test locally
+            warmup_tracker.touch(agent_url)
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.is_error:
+                await response.aread()
+                if response.status_code == 404:
+                    forget_lost_session(
+                        request.auth.user_email, agent_name, session_id, agent_url
+                    )
+                raise_for_upstream(response, agent_url)
+            # decode events as the body arrives instead of buffering it
+            answer = []
+            decoder = EventArrayDecoder()
+            async for chunk in response.aiter_bytes():
+                UPSTREAM_RESPONSE_BYTES.inc(len(chunk), agent=agent_name)
+                parse_start = time.perf_counter()
+                for event in decoder.feed(chunk):
+                    answer.extend(parse_event(event))
+                parse_seconds += time.perf_counter() - parse_start
+            for event in decoder.close():
+                answer.extend(parse_event(event))
+        return answer
+
+    with (
+        UPSTREAM_IN_FLIGHT.track_in_progress(agent=agent_name),
+        track_replica(agent_url),
+    ):
+        response_parsed = await upstream_guard.call(
+            agent_url, "run", request.timeout, run
+        )
+    STAGE_DURATION.observe(
+        time.perf_counter() - upstream_start - parse_seconds,
+        endpoint=endpoint,
+        agent=agent_name,
+        stage="upstream",
+    )
+    STAGE_DURATION.observe(
+        parse_seconds, endpoint=endpoint, agent=agent_name, stage="parse"
+    )
+    UPSTREAM_LATENCY.observe(
+        time.perf_counter() - upstream_start, agent=agent_name, start=start_label
+    )
+    return response_parsed
+
+
+async def run_in_session(
+    request: QueryRequest, agent_urls: list[str], endpoint: str
+) -> list:
+    """Get the query a session and run it there, hedged if enabled"""
+    user_email = request.auth.user_email
+    agent_name = request.auth.agent_name
+    with time_stage("session", endpoint, agent_name):
+        session_id, agent_url = await get_session_for_query(request, agent_urls)
 
-        # user_id = email_to_id(user_email)
-        user_id = "user"
-        session_id = request.current_session_id or await create_session_for_user(
+    if not hedger.enabled(request):
+        return await run_on_replica(request, endpoint, agent_url, session_id)
+
+    async def backup() -> list:
+        # another replica if there is one, else another instance behind
+        # the same url; either way in a session of its own
+        others = [url for url in agent_urls if url != agent_url] or agent_urls
+        backup_session_id, backup_url = await create_session_for_user(
+            user_email, agent_name, others
+        )
+        return await run_on_replica(request, endpoint, backup_url, backup_session_id)
+
+    return await hedger.run(
+        agent_name,
+        lambda: run_on_replica(request, endpoint, agent_url, session_id),
+        backup,
+    )
+
+
+@tracer.start_as_current_span("query")
+async def run_query(request: QueryRequest, endpoint: str = "/query") -> QueryResponse:
+    """Run one query against the agent's /run endpoint"""
+    user_email = request.auth.user_email
+    agent_name = request.auth.agent_name
+    trace.get_current_span().set_attributes(
+        {"gateway.agent_name": agent_name, "gateway.endpoint": endpoint}
+    )
+    with time_stage("registry", endpoint, agent_name):
+        agent_urls = call_db_for_agent_urls(
             user_email=user_email, agent_name=agent_name
         )
-        # session_id = "6c38fa03-9ca5-488f-b52d-d9bbb6173ade" # LOCAL
-        runsse_body = get_runsse_body(agent_name, user_id, session_id, request.query)
-        payload = runsse_body.model_dump()
-
-        # Comment to test locally
-        id_token = authorize_url(agent_url)
-        headers = {"Authorization": f"Bearer {id_token}"}
-        # Comment to test locally
-        async with httpx.AsyncClient(timeout=request.timeout) as client:
-            response = await client.post(
-                url, headers=headers, json=payload
-            )  # delete headers to test locally
-            response_parsed = parse_response(response.text)
-            return QueryResponse(
-                success=True, query=request.query, answer=response_parsed
-            )
+
+    if agent_urls and all(health_monitor.is_down(url) for url in agent_urls):
+        # don't wait out the timeout on an agent whose calls keep failing
+        mark_error("agent unavailable")
+        return QueryResponse(
+            success=False,
+            query=request.query,
+            answer=[],
+            error=f"Agent {agent_name} is unavailable (health checks failing)",
+        )
+
+    try:
+        try:
+            response_parsed = await run_in_session(request, agent_urls, endpoint)
+        except UpstreamError as e:
+            if not is_lost_session(e):
+                raise
+            # the session was forgotten, this gets (or recreates) a fresh one
+            response_parsed = await run_in_session(request, agent_urls, endpoint)
+        return QueryResponse(
+            success=True, query=request.query, answer=response_parsed
+        )
     except httpx.TimeoutException:
+        mark_error("Connection timeout")
         return QueryResponse(
             success=False,
             query=request.query,
@@ -287,6 +1068,7 @@ async def query_agent(request: QueryRequest):
             error="Connection timeout",
         )
     except Exception as e:
+        mark_error(str(e))
         return QueryResponse(
             success=False,
             query=request.query,
@@ -295,6 +1077,251 @@ async def query_agent(request: QueryRequest):
         )
 
 
+@app.post("/query/batch")
+async def query_agent_batch(
+    http_request: Request,
+    max_concurrency_per_agent: int = Query(
+        default=BATCH_AGENT_CONCURRENCY, ge=1, le=BATCH_AGENT_CONCURRENCY_MAX
+    ),
+):
+    """Run many queries concurrently, streaming results back as JSONL.
+
+    The body is either a BatchQueryRequest or JSONL with one QueryRequest
+    per line (Content-Type application/x-ndjson or application/jsonl).
+    Results are written in completion order, each tagged with the index of
+    its query; at most `max_concurrency_per_agent` queries run at once
+    against the same agent url.
+    """
+    body = await http_request.body()
+    content_type = http_request.headers.get("content-type", "")
+    try:
+        if any(t in content_type for t in ("ndjson", "jsonl", "json-lines")):
+            queries = [
+                QueryRequest.model_validate_json(line)
+                for line in body.splitlines()
+                if line.strip()
+            ]
+        else:
+            queries = BatchQueryRequest.model_validate_json(body).queries
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+    semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def run_one(index: int, query: QueryRequest) -> BatchQueryResult:
+        agent_url = call_db_for_agent_url(
+            user_email=query.auth.user_email, agent_name=query.auth.agent_name
+        )
+        semaphore = semaphores.setdefault(
+            agent_url, asyncio.Semaphore(max_concurrency_per_agent)
+        )
+        try:
+            # like /query: only users who may ask the agent get cached answers
+            await rate_limiter.check(query.auth.user_email, query.auth.agent_name)
+        except RateLimited as e:
+            response = QueryResponse(
+                success=False, query=query.query, answer=[], error=str(e)
+            )
+            return BatchQueryResult(index=index, response=response)
+        response = response_cache.lookup(query) if agent_url else None
+        if response is None:
+            async with semaphore:
+                try:
+                    response = await run_query_shared(
+                        query, endpoint="/query/batch", priority="batch"
+                    )
+                except AdmissionRejected as e:
+                    response = QueryResponse(
+                        success=False, query=query.query, answer=[], error=str(e)
+                    )
+            response_cache.store(query, response)
+        return BatchQueryResult(index=index, response=response)
+
+    async def results():
+        tasks = [
+            asyncio.create_task(run_one(index, query))
+            for index, query in enumerate(queries)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield result.model_dump_json() + "\n"
+        finally:
+            # client went away, stop the rest of the batch
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def stream_query(
+    request: QueryRequest, agent_urls: list[str], endpoint: str
+) -> AsyncIterator[tuple[str, dict]]:
+    """Run the query through /run_sse of the replica holding its session.
+
+    Yields ("session", {"session_id": ...}) first, then ("part", part) for
+    every AgentAnswerPart as it arrives; errors are raised. A session the
+    agent lost is replaced once, before anything was yielded.
+    """
+    started = False
+    try:
+        async for item in stream_in_session(request, agent_urls, endpoint):
+            started = True
+            yield item
+    except UpstreamError as e:
+        if started or not is_lost_session(e):
+            raise
+    else:
+        return
+    async for item in stream_in_session(request, agent_urls, endpoint):
+        yield item
+
+
+async def stream_in_session(
+    request: QueryRequest, agent_urls: list[str], endpoint: str
+) -> AsyncIterator[tuple[str, dict]]:
+    agent_name = request.auth.agent_name
+    user_id = "user"
+    with time_stage("session", endpoint, agent_name):
+        session_id, agent_url = await get_session_for_query(request, agent_urls)
+    url = f"{agent_url.rstrip('/')}/run_sse"
+
+    runsse_body = get_runsse_body(agent_name, user_id, session_id, request.query)
+    payload = runsse_body.model_dump_json().encode()
+    UPSTREAM_REQUEST_BYTES.inc(len(payload), agent=agent_name)
+
+    with time_stage("authorize", endpoint, agent_name):
+        id_token = await authorize_url(agent_url)
+    headers = {
+        "Authorization": f"Bearer {id_token}",
+        "Content-Type": "application/json",
+    }
+    client = upstream_pool.get(agent_url)
+    start_label = warmup_tracker.start_label(agent_url)
+    upstream_start = time.perf_counter()
+    first_event = True
+    with (
+        UPSTREAM_IN_FLIGHT.track_in_progress(agent=agent_name),
+        # a stream's length says nothing about the replica, only count it
+        track_replica(agent_url, sample_latency=False),
+    ):
+        async with AsyncExitStack() as stack:
+            # events keep arriving for the whole run, so only the circuit
+            # breaker applies here, not the adaptive total timeout
+            with upstream_guard.guard(agent_url):
+                response = await stack.enter_async_context(
+                    client.stream(
+                        "POST",
+                        url,
+                        headers=headers,
+                        content=payload,
+                        timeout=request.timeout,
+                    )
+                )
+                warmup_tracker.touch(agent_url)
+                if response.is_error:
+                    await response.aread()
+                    if response.status_code == 404:
+                        forget_lost_session(
+                            request.auth.user_email, agent_name, session_id, agent_url
+                        )
+                    raise_for_upstream(response, agent_url)
+            yield "session", {"session_id": session_id}
+
+            async for line in response.aiter_lines():
+                UPSTREAM_RESPONSE_BYTES.inc(len(line) + 1, agent=agent_name)
+                if not line.startswith("data:"):
+                    continue
+                if first_event:
+                    first_event = False
+                    STAGE_DURATION.observe(
+                        time.perf_counter() - upstream_start,
+                        endpoint=endpoint,
+                        agent=agent_name,
+                        stage="first_event",
+                    )
+                event = json.loads(line[len("data:") :])
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                for part in parse_event(event):
+                    yield "part", part.model_dump()
+    STAGE_DURATION.observe(
+        time.perf_counter() - upstream_start,
+        endpoint=endpoint,
+        agent=agent_name,
+        stage="upstream",
+    )
+    UPSTREAM_LATENCY.observe(
+        time.perf_counter() - upstream_start, agent=agent_name, start=start_label
+    )
+
+
+@app.post("/query/stream")
+async def query_agent_stream(request: QueryRequest):
+    """Proxy /run_sse of an ADK agent, forwarding answer parts as they arrive.
+
+    Emits a `session` event with the session id first, then one `data` event
+    per AgentAnswerPart, and finally `done` (or `error`).
+    """
+    user_email = request.auth.user_email
+    agent_name = request.auth.agent_name
+    endpoint = "/query/stream"
+    with time_stage("registry", endpoint, agent_name):
+        agent_urls = call_db_for_agent_urls(
+            user_email=user_email, agent_name=agent_name
+        )
+    limit = await rate_limiter.check(user_email, agent_name)
+    # taken before the response starts, so a full queue is still a 429;
+    # released by the response, the generator may never start
+    acquired_at = await admission.acquire(agent_name)
+
+    async def event_stream():
+        try:
+            async for event, data in stream_query(request, agent_urls, endpoint):
+                if event == "session":
+                    yield sse_event(json.dumps(data), event="session")
+                else:
+                    yield sse_event(json.dumps(data))
+        except httpx.TimeoutException:
+            yield sse_event(json.dumps({"error": "Connection timeout"}), event="error")
+            return
+        except Exception as e:
+            yield sse_event(json.dumps({"error": str(e)}), event="error")
+            return
+        yield sse_event("{}", event="done")
+
+    return ClosingStreamingResponse(
+        event_stream(),
+        on_close=lambda: admission.release(agent_name, acquired_at),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            **(limit.headers() if limit is not None else {}),
+        },
+    )
+
+
+@app.websocket("/ws")
+async def conversations_websocket(websocket: WebSocket):
+    """Many agent conversations over one WebSocket, see ws.ConversationMux"""
+    await websocket.accept()
+
+    async def run_conversation(request: QueryRequest) -> AsyncIterator[tuple[str, dict]]:
+        user_email = request.auth.user_email
+        agent_name = request.auth.agent_name
+        with time_stage("registry", "/ws", agent_name):
+            agent_urls = call_db_for_agent_urls(
+                user_email=user_email, agent_name=agent_name
+            )
+        await rate_limiter.check(user_email, agent_name)
+        async with admission.admit(agent_name):
+            async for event in stream_query(request, agent_urls, "/ws"):
+                yield event
+
+    await ConversationMux(websocket, run_conversation).serve()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,322 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+
+# Seconds; upstream agent runs can take minutes
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300,
+)  # fmt: skip
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple, extra: str = ""):
+    pairs = [
+        f'{name}="{escape_label(value)}"'
+        for name, value in zip(label_names, label_values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            histogram = self._values[key] = HistogramValue(self.buckets)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            histogram.counts[index] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key: tuple, histogram: HistogramValue) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, histogram.counts):
+            cumulative += count
+            labels = format_labels(self.label_names, key, f'le="{format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {histogram.count}")
+        labels = format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(histogram.sum)}")
+        lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal in-process metrics rendered in the Prometheus text format.
+
+    Values are per worker process; scrape every worker (or run one) to get
+    the full picture.
+    """
+
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def _register(self, metric: Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "gateway_http_requests_total",
+    "Gateway HTTP requests by endpoint and status code",
+    ("endpoint", "method", "status"),
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "gateway_http_request_duration_seconds",
+    "Gateway HTTP request duration",
+    ("endpoint", "method"),
+)
+HTTP_REQUEST_BYTES = REGISTRY.counter(
+    "gateway_http_request_bytes_total",
+    "Bytes received in gateway request bodies",
+    ("endpoint",),
+)
+HTTP_RESPONSE_BYTES = REGISTRY.counter(
+    "gateway_http_response_bytes_total",
+    "Bytes sent in gateway response bodies",
+    ("endpoint",),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "gateway_http_in_flight_requests",
+    "Gateway HTTP requests currently being served",
+    ("endpoint",),
+)
+STAGE_DURATION = REGISTRY.histogram(
+    "gateway_stage_duration_seconds",
+    "Time spent per query stage (registry, session, authorize, upstream, parse, first_event)",
+    ("endpoint", "agent", "stage"),
+)
+UPSTREAM_REQUEST_BYTES = REGISTRY.counter(
+    "gateway_upstream_request_bytes_total",
+    "Bytes sent to agent services",
+    ("agent",),
+)
+UPSTREAM_RESPONSE_BYTES = REGISTRY.counter(
+    "gateway_upstream_response_bytes_total",
+    "Bytes received from agent services",
+    ("agent",),
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "gateway_upstream_in_flight_requests",
+    "Agent runs currently in flight",
+    ("agent",),
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "gateway_upstream_latency_seconds",
+    "Agent call latency split by likely cold or warm instance"
+    " (warmup_cold/warmup_warm for /warmup probes)",
+    ("agent", "start"),
+)
+
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    "gateway_admission_queue_wait_seconds",
+    "Time queries waited for an upstream slot of the agent",
+    ("agent", "priority"),
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "gateway_admission_queued",
+    "Queries currently waiting for an upstream slot",
+    ("agent",),
+)
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "gateway_admission_in_flight",
+    "Queries currently holding an upstream slot",
+    ("agent",),
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "gateway_admission_rejected_total",
+    "Queries turned away because the agent's queue was full",
+    ("agent", "priority"),
+)
+RATE_LIMITED = REGISTRY.counter(
+    "gateway_rate_limited_total",
+    "Queries turned away because the user's token bucket was empty",
+    ("agent",),
+)
+HEDGED_QUERIES = REGISTRY.counter(
+    "gateway_hedged_queries_total",
+    "Queries that reached the hedge delay, by outcome (primary_won, backup_won, both_failed, over_budget)",
+    ("agent", "outcome"),
+)
+
+
+def time_stage(stage: str, endpoint: str, agent: str):
+    """Context manager timing one stage of a query"""
+    return STAGE_DURATION.time(endpoint=endpoint, agent=agent, stage=stage)
+
+
+def route_template(scope) -> str:
+    """Path template of the route the request matches, e.g. /deploy/{job_id}"""
+    router = scope["app"].router
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, bytes, duration and in-flight.
+
+    Endpoints are labelled by their route template (e.g. /deploy/{job_id})
+    so path parameters don't blow up label cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_template(scope)
+        method = scope["method"]
+        status = "500"
+        start = time.perf_counter()
+
+        async def receive_counting():
+            message = await receive()
+            if message["type"] == "http.request":
+                HTTP_REQUEST_BYTES.inc(len(message.get("body", b"")), endpoint=endpoint)
+            return message
+
+        async def send_counting(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                HTTP_RESPONSE_BYTES.inc(len(message.get("body", b"")), endpoint=endpoint)
+            await send(message)
+
+        try:
+            with HTTP_IN_FLIGHT.track_in_progress(endpoint=endpoint):
+                await self.app(scope, receive_counting, send_counting)
+        finally:
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+            HTTP_DURATION.observe(
+                time.perf_counter() - start, endpoint=endpoint, method=method
+            )
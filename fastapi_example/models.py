@@ -10,7 +10,16 @@ class FrontendRequest(BaseModel):
 
 
 class DeployRequest(FrontendRequest):
-    pass
+    # optional overrides of the cold-start related DeployRequestInner settings
+    min_instances: int | None = None
+    cpu_boost: bool | None = None
+    concurrency: int | None = None
+    deploy_mode: str | None = None
+    traffic_steps: list[int] | None = None
+
+
+class AgentReplicaRequest(FrontendRequest):
+    agent_url: str
 
 
 class DeployResponse(BaseModel):
@@ -19,6 +28,42 @@ class DeployResponse(BaseModel):
     url: str
 
 
+class DeployJobStatus(BaseModel):
+    job_id: str
+    user_email: str
+    agent_name: str
+    status: str  # queued | running | succeeded | failed
+    message: str = ""
+    unique_service_name: str = ""
+    url: str = ""
+    created_at: float
+    updated_at: float
+
+
+class DeployBatchRequest(BaseModel):
+    user_email: str = (
+        "mikolaj.machalski@accenture.com"  # MOCKED, TO BE GET FROM FRONTEND
+    )
+    agent_names: list[str]
+    wait: bool = False  # respond only once every deploy has finished
+    min_instances: int | None = None
+    cpu_boost: bool | None = None
+    concurrency: int | None = None
+    deploy_mode: str | None = None
+    traffic_steps: list[int] | None = None
+
+
+class DeployBatchResponse(BaseModel):
+    jobs: list[DeployJobStatus]
+
+
+class DeployJobEvent(BaseModel):
+    job_id: str
+    status: str
+    message: str = ""
+    elapsed_s: float = 0.0
+
+
 # move all deployment parameters to env, for deployment
 class DeployRequestInner(BaseModel):
     agent_name: str
@@ -33,6 +78,28 @@ class DeployRequestInner(BaseModel):
     service_account: str | None = (
         "adk-cloud-run@acn-daipl.iam.gserviceaccount.com"  # to change to be unique?
     )
+    # cold start mitigation: instances kept warm, extra CPU while starting,
+    # and max concurrent requests per instance (None = Cloud Run default)
+    min_instances: int = 0
+    cpu_boost: bool = False
+    concurrency: int | None = None
+    # "update" rolls a new revision onto the (user, agent) service and skips
+    # unchanged deploys, "create" makes a new timestamped service every time
+    deploy_mode: str = "update"  # update | create
+    # percent of traffic on the new revision after each step, e.g. [10, 50, 100]
+    traffic_steps: list[int] = [100]
+    traffic_step_interval: float = 60
+
+    @model_validator(mode="after")
+    def check_rollout(self):
+        if self.deploy_mode not in ("update", "create"):
+            raise ValueError("deploy_mode must be 'update' or 'create'")
+        steps = self.traffic_steps
+        if any(not 0 < step <= 100 for step in steps) or steps != sorted(set(steps)):
+            raise ValueError("traffic_steps must be increasing percents in 1..100")
+        if not steps or steps[-1] != 100:
+            self.traffic_steps = [*steps, 100]
+        return self
 
     @model_validator(mode="after")
     def set_image(self):
@@ -42,6 +109,15 @@ class DeployRequestInner(BaseModel):
         return self
 
 
+class WarmupRequest(BaseModel):
+    user_email: str
+    agent_names: list[str] | None = None  # None = all agents of the user
+
+
+class WarmupResponse(BaseModel):
+    scheduled: list[str]
+
+
 class TestConnectionRequest(BaseModel):
     agent_url: str
     endpoint: str = "/health"  # default health check endpoint
@@ -55,6 +131,20 @@ class TestConnectionResponse(BaseModel):
     message: str
 
 
+class AgentHealth(BaseModel):
+    agent_url: str
+    agent_names: list[str]
+    status: str  # up | down | unknown
+    samples: int
+    error_rate: float
+    p50_ms: float | None = None
+    p95_ms: float | None = None
+    p99_ms: float | None = None
+    consecutive_failures: int = 0
+    last_checked: float | None = None
+    last_error: str | None = None
+
+
 class MessagePart(BaseModel):
     text: str
 
@@ -82,7 +172,11 @@ class QueryRequest(BaseModel):
 
 class AgentAnswerPart(BaseModel):
     agent_name: str
-    text: str
+    text: str = ""
+    # text | thought | function_call | function_response | executable_code
+    # | code_execution_result | file
+    kind: str = "text"
+    data: dict | None = None
 
 
 class QueryResponse(BaseModel):
@@ -90,3 +184,23 @@ class QueryResponse(BaseModel):
     query: str
     answer: list[AgentAnswerPart]
     error: Optional[str] = None
+
+
+class WsQueryMessage(QueryRequest):
+    type: str = "query"
+    id: str  # chosen by the client, tags every reply of this conversation
+
+
+class WsServerMessage(BaseModel):
+    type: str  # session | part | done | error | cancelled
+    id: str
+    data: dict = {}
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[QueryRequest]
+
+
+class BatchQueryResult(BaseModel):
+    index: int
+    response: QueryResponse
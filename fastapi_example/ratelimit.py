@@ -0,0 +1,234 @@
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from cache import parse_agent_map
+from metrics import RATE_LIMITED
+
+
+# Own database, not the registry's: every query writes here, and a write to
+# the registry file would drop every worker's registry cache
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", "rate_limits.db")
+# Tokens per minute and bucket size per user, across all agents; 0 = no limit.
+# Off by default: /query/batch and load tests legitimately send hundreds of
+# queries per user, enable per deployment (e.g. 120 and 60)
+RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "0"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "60"))
+# The same per (user, agent), with per agent overrides "agent=number,..."
+RATE_LIMIT_AGENT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_AGENT_PER_MINUTE", "0"))
+RATE_LIMIT_AGENT_BURST = float(os.environ.get("RATE_LIMIT_AGENT_BURST", "30"))
+RATE_LIMIT_AGENT_RATES = os.environ.get("RATE_LIMIT_AGENT_RATES", "")
+RATE_LIMIT_AGENT_BURSTS = os.environ.get("RATE_LIMIT_AGENT_BURSTS", "")
+# Tokens one query of the agent takes from both buckets, default 1,
+# e.g. "short_movie=10"
+RATE_LIMIT_AGENT_COSTS = os.environ.get("RATE_LIMIT_AGENT_COSTS", "")
+# Buckets untouched for this long are dropped (they're full again by then)
+RATE_LIMIT_IDLE_SECONDS = float(os.environ.get("RATE_LIMIT_IDLE_SECONDS", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Bucket:
+    key: str
+    per_minute: float
+    burst: float
+
+    def refill(self, tokens: float, elapsed: float) -> float:
+        return min(self.burst, tokens + elapsed * self.per_minute / 60)
+
+    def seconds_until(self, tokens: float, needed: float) -> float:
+        return max(0.0, (needed - tokens) * 60 / self.per_minute)
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: float  # burst of the tightest bucket
+    remaining: float
+    reset_after: float  # seconds until that bucket is full again
+    retry_after: float  # seconds until the query would be allowed
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(math.floor(self.limit)),
+            "X-RateLimit-Remaining": str(math.floor(self.remaining)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class RateLimited(Exception):
+    def __init__(self, user_email: str, agent_name: str, result: RateLimitResult):
+        super().__init__(
+            f"Rate limit exceeded for {user_email} on {agent_name},"
+            f" retry in {math.ceil(result.retry_after)}s"
+        )
+        self.result = result
+
+
+class RateLimiter:
+    """Token buckets per user and per (user, agent), shared by all workers.
+
+    Bucket state lives in a SQLite database in WAL mode; a query takes
+    `cost` tokens from both of its buckets in one IMMEDIATE transaction, so
+    concurrent workers can't both spend the last tokens. A query that
+    doesn't fit in one of them takes from neither. The database is opened
+    by `open()`, on app startup; `check()` runs the transaction in a thread,
+    waiting on another worker's lock must not stall the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str = RATE_LIMIT_PATH,
+        user_per_minute: float = RATE_LIMIT_USER_PER_MINUTE,
+        user_burst: float = RATE_LIMIT_USER_BURST,
+        agent_per_minute: float = RATE_LIMIT_AGENT_PER_MINUTE,
+        agent_burst: float = RATE_LIMIT_AGENT_BURST,
+        agent_rates: dict[str, float] | None = None,
+        agent_bursts: dict[str, float] | None = None,
+        agent_costs: dict[str, float] | None = None,
+        idle_seconds: float = RATE_LIMIT_IDLE_SECONDS,
+    ):
+        self.path = path
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.agent_per_minute = agent_per_minute
+        self.agent_burst = agent_burst
+        self.agent_rates = (
+            parse_agent_map(RATE_LIMIT_AGENT_RATES)
+            if agent_rates is None
+            else agent_rates
+        )
+        self.agent_bursts = (
+            parse_agent_map(RATE_LIMIT_AGENT_BURSTS)
+            if agent_bursts is None
+            else agent_bursts
+        )
+        self.agent_costs = (
+            parse_agent_map(RATE_LIMIT_AGENT_COSTS)
+            if agent_costs is None
+            else agent_costs
+        )
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._last_pruned = time.time()
+        self._conn: sqlite3.Connection | None = None
+
+    def open(self):
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=5
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def buckets(self, user_email: str, agent_name: str) -> list[Bucket]:
+        buckets = []
+        if self.user_per_minute > 0:
+            buckets.append(
+                Bucket(f"user:{user_email}", self.user_per_minute, self.user_burst)
+            )
+        per_minute = self.agent_rates.get(agent_name, self.agent_per_minute)
+        if per_minute > 0:
+            buckets.append(
+                Bucket(
+                    f"agent:{user_email}:{agent_name}",
+                    per_minute,
+                    self.agent_bursts.get(agent_name, self.agent_burst),
+                )
+            )
+        return buckets
+
+    def cost(self, agent_name: str) -> float:
+        return self.agent_costs.get(agent_name, 1.0)
+
+    def take(self, user_email: str, agent_name: str) -> RateLimitResult | None:
+        """Spend one query's tokens; None when no limit applies"""
+        buckets = self.buckets(user_email, agent_name)
+        if not buckets:
+            return None
+        cost = self.cost(agent_name)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # read under the write lock, so updated_at never goes backwards
+                now = time.time()
+                levels = []
+                for bucket in buckets:
+                    row = self._conn.execute(
+                        "SELECT tokens, updated_at FROM buckets WHERE key = ?",
+                        (bucket.key,),
+                    ).fetchone()
+                    tokens = (
+                        bucket.burst
+                        if row is None
+                        else bucket.refill(row[0], max(0.0, now - row[1]))
+                    )
+                    levels.append(tokens)
+                allowed = all(tokens >= cost for tokens in levels)
+                if allowed:
+                    levels = [tokens - cost for tokens in levels]
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                        [
+                            (bucket.key, tokens, now)
+                            for bucket, tokens in zip(buckets, levels)
+                        ],
+                    )
+                if now - self._last_pruned > self.idle_seconds:
+                    self._conn.execute(
+                        "DELETE FROM buckets WHERE updated_at < ?",
+                        (now - self.idle_seconds,),
+                    )
+                    self._last_pruned = now
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        # report the bucket closest to running out
+        bucket, tokens = min(
+            zip(buckets, levels), key=lambda item: item[1] / item[0].burst
+        )
+        retry_after = max(
+            bucket.seconds_until(tokens, cost)
+            for bucket, tokens in zip(buckets, levels)
+        )
+        return RateLimitResult(
+            allowed=allowed,
+            limit=bucket.burst,
+            remaining=max(0.0, tokens),
+            reset_after=bucket.seconds_until(tokens, bucket.burst),
+            retry_after=0.0 if allowed else retry_after,
+        )
+
+    async def check(
+        self, user_email: str, agent_name: str
+    ) -> RateLimitResult | None:
+        """take() in a thread, raising RateLimited when the query doesn't fit"""
+        if not self.buckets(user_email, agent_name):
+            return None  # no limit applies, skip the thread hop
+        result = await asyncio.to_thread(self.take, user_email, agent_name)
+        if result is not None and not result.allowed:
+            RATE_LIMITED.inc(agent=agent_name)
+            raise RateLimited(user_email, agent_name, result)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+AGENT_REGISTRY_PATH = os.environ.get("AGENT_REGISTRY_PATH", "agent_registry.db")
+AGENT_REGISTRY_CACHE_SIZE = int(os.environ.get("AGENT_REGISTRY_CACHE_SIZE", "4096"))
+
+
+# one agent_urls row per replica of a user's agent
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS agent_urls (
+        user_email TEXT NOT NULL,
+        agent_name TEXT NOT NULL,
+        agent_url TEXT NOT NULL,
+        PRIMARY KEY (user_email, agent_name, agent_url)
+    )""",
+    """CREATE TABLE IF NOT EXISTS agent_env_vars (
+        agent_name TEXT PRIMARY KEY,
+        env_vars TEXT NOT NULL
+    )""",
+]
+SCHEMA_VERSION = 1
+
+# statements taking a database from the previous version to the key's one
+MIGRATIONS = {
+    # agent_urls held a single url per (user_email, agent_name)
+    1: [
+        "ALTER TABLE agent_urls RENAME TO agent_urls_v0",
+        SCHEMA[0],
+        "INSERT INTO agent_urls SELECT user_email, agent_name, agent_url"
+        " FROM agent_urls_v0",
+        "DROP TABLE agent_urls_v0",
+    ],
+}
+
+
+class AgentRegistry:
+    """Agent url / env var registry shared by every gateway worker.
+
+    Backed by a local SQLite database in WAL mode, so all uvicorn workers of
+    a container see the same rows. Reads go through an in-process LRU; each
+    lookup checks `PRAGMA data_version`, which changes whenever another
+    connection (another worker, e.g. after a deploy) commits, and drops the
+    LRU when it does. The database is opened by `open()`, on app startup.
+    """
+
+    def __init__(
+        self,
+        path: str = AGENT_REGISTRY_PATH,
+        cache_size: int = AGENT_REGISTRY_CACHE_SIZE,
+        seed_urls: dict[tuple[str, str], str] | None = None,
+        seed_env_vars: dict[str, dict[str, str]] | None = None,
+    ):
+        self.path = path
+        self.cache_size = cache_size
+        self.seed_urls = seed_urls or {}
+        self.seed_env_vars = seed_env_vars or {}
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple, object] = OrderedDict()
+        self._conn: sqlite3.Connection | None = None
+        self._data_version = 0
+
+    def open(self):
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=5
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._seed(self.seed_urls, self.seed_env_vars)
+        self._data_version = self._read_data_version()
+        self._cache.clear()
+
+    def _migrate(self):
+        # IMMEDIATE so concurrently starting workers migrate one at a time
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+                existing = self._conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'agent_urls'"
+                ).fetchone()
+                if existing is not None:
+                    for target in range(version + 1, SCHEMA_VERSION + 1):
+                        logger.info(f"Migrating agent registry to version {target}")
+                        for statement in MIGRATIONS[target]:
+                            self._conn.execute(statement)
+                for statement in SCHEMA:
+                    self._conn.execute(statement)
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _seed(
+        self,
+        seed_urls: dict[tuple[str, str], str],
+        seed_env_vars: dict[str, dict[str, str]],
+    ):
+        # INSERT OR IGNORE keeps whatever other workers already saved
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            # only agents without any url yet, seeds don't become extra replicas
+            self._conn.executemany(
+                "INSERT INTO agent_urls SELECT ?, ?, ? WHERE NOT EXISTS ("
+                "SELECT 1 FROM agent_urls WHERE user_email = ? AND agent_name = ?)",
+                [
+                    (user, agent, url, user, agent)
+                    for (user, agent), url in seed_urls.items()
+                ],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO agent_env_vars VALUES (?, ?)",
+                [(agent, json.dumps(env)) for agent, env in seed_env_vars.items()],
+            )
+            self._conn.execute("COMMIT")
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _cached(self, key: tuple, load):
+        with self._lock:
+            data_version = self._read_data_version()
+            if data_version != self._data_version:
+                # another worker wrote to the registry
+                self._cache.clear()
+                self._data_version = data_version
+
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            value = load()
+            self._remember(key, value)
+            return value
+
+    def _remember(self, key: tuple, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_agent_urls(self, user_email: str, agent_name: str) -> list[str]:
+        """Replica urls of the agent, the first registered one first"""
+
+        def load():
+            rows = self._conn.execute(
+                "SELECT agent_url FROM agent_urls"
+                " WHERE user_email = ? AND agent_name = ? ORDER BY rowid",
+                (user_email, agent_name),
+            ).fetchall()
+            return tuple(row[0] for row in rows)
+
+        return list(self._cached(("urls", user_email, agent_name), load))
+
+    def get_agent_url(self, user_email: str, agent_name: str) -> str:
+        agent_urls = self.get_agent_urls(user_email, agent_name)
+        return agent_urls[0] if agent_urls else ""
+
+    def save_agent_url(self, user_email: str, agent_name: str, agent_url: str):
+        """Point the agent at a deployed url.
+
+        A url the agent already has (an in-place redeploy) keeps the other
+        replicas; a new one replaces them, the old services are gone.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            known = self._conn.execute(
+                "SELECT 1 FROM agent_urls"
+                " WHERE user_email = ? AND agent_name = ? AND agent_url = ?",
+                (user_email, agent_name, agent_url),
+            ).fetchone()
+            if known is None:
+                self._conn.execute(
+                    "DELETE FROM agent_urls WHERE user_email = ? AND agent_name = ?",
+                    (user_email, agent_name),
+                )
+                self._conn.execute(
+                    "INSERT INTO agent_urls VALUES (?, ?, ?)",
+                    (user_email, agent_name, agent_url),
+                )
+            self._conn.execute("COMMIT")
+            self._cache.pop(("urls", user_email, agent_name), None)
+
+    def add_agent_replica(self, user_email: str, agent_name: str, agent_url: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO agent_urls VALUES (?, ?, ?)",
+                (user_email, agent_name, agent_url),
+            )
+            self._cache.pop(("urls", user_email, agent_name), None)
+
+    def remove_agent_replica(self, user_email: str, agent_name: str, agent_url: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM agent_urls"
+                " WHERE user_email = ? AND agent_name = ? AND agent_url = ?",
+                (user_email, agent_name, agent_url),
+            )
+            self._cache.pop(("urls", user_email, agent_name), None)
+
+    def list_agent_urls(self) -> list[tuple[str, str, str]]:
+        """All (user_email, agent_name, agent_url) rows, one per replica"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_email, agent_name, agent_url FROM agent_urls"
+            ).fetchall()
+
+    def get_env_vars(self, agent_name: str) -> dict[str, str]:
+        def load():
+            row = self._conn.execute(
+                "SELECT env_vars FROM agent_env_vars WHERE agent_name = ?",
+                (agent_name,),
+            ).fetchone()
+            return json.loads(row[0]) if row else {}
+
+        return dict(self._cached(("env", agent_name), load))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,209 @@
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from typing import TypeVar
+
+import httpx
+
+from health import RollingLatency
+
+
+logger = logging.getLogger(__name__)
+
+
+# Consecutive failures (errors, timeouts, 5xx) that open an agent's circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Seconds an open circuit waits before letting probe requests through
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+# Concurrent probe requests allowed while half-open
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Adaptive timeout = observed p99 * multiplier, clamped to [min, request timeout]
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.environ.get("ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = int(os.environ.get("ADAPTIVE_TIMEOUT_MIN_SAMPLES", "20"))
+ADAPTIVE_TIMEOUT_WINDOW = int(os.environ.get("ADAPTIVE_TIMEOUT_WINDOW", "200"))
+ADAPTIVE_TIMEOUT_MIN = {
+    "run": float(os.environ.get("ADAPTIVE_TIMEOUT_MIN_RUN", "30")),
+    "session": float(os.environ.get("ADAPTIVE_TIMEOUT_MIN_SESSION", "5")),
+}
+
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    """Agent answered with an error status"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Agent returned {status_code}: {message}")
+        self.status_code = status_code
+
+    @property
+    def is_failure(self) -> bool:
+        # overload and server errors count against the agent, 4xx don't
+        return self.status_code >= 500 or self.status_code == 429
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, agent_url: str, retry_after: float):
+        super().__init__(
+            f"Circuit open for {agent_url}, retry in {retry_after:.0f}s"
+        )
+        self.agent_url = agent_url
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after a
+    cool-down, where a few probe requests decide between closed and open"""
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a request may go out now; must be followed by a record_*"""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                return False
+            self.state = "half_open"
+            self._probes = 0
+        if self.state == "half_open":
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probes = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probes = 0
+
+    def record_neutral(self):
+        """Request ended without telling anything about the agent"""
+        if self.state == "half_open" and self._probes > 0:
+            self._probes -= 1
+
+    def record_exception(self, exc: BaseException):
+        """Record a request that raised: timeouts, connection errors and
+        5xx/429 count as failures, other error statuses mean the agent is
+        up, anything else (e.g. cancellation) says nothing about it"""
+        if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+            self.record_failure()
+        elif isinstance(exc, UpstreamError):
+            if exc.is_failure:
+                self.record_failure()
+            else:
+                self.record_success()
+        else:
+            self.record_neutral()
+
+
+class UpstreamGuard:
+    """Per agent url circuit breakers plus latency-derived timeouts.
+
+    `call` wraps one upstream operation ("run", "session"): it fails fast
+    while the agent's circuit is open, gives the operation a timeout derived
+    from its observed latency, and feeds the outcome back into both.
+    `guard` is the breaker part alone, for calls without a total timeout.
+    """
+
+    def __init__(
+        self,
+        multiplier: float = ADAPTIVE_TIMEOUT_MULTIPLIER,
+        min_samples: int = ADAPTIVE_TIMEOUT_MIN_SAMPLES,
+        window: int = ADAPTIVE_TIMEOUT_WINDOW,
+        min_timeouts: dict[str, float] = ADAPTIVE_TIMEOUT_MIN,
+    ):
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.window = window
+        self.min_timeouts = min_timeouts
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latencies: dict[tuple[str, str], RollingLatency] = {}
+
+    def breaker(self, agent_url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(agent_url)
+        if breaker is None:
+            breaker = self._breakers[agent_url] = CircuitBreaker()
+        return breaker
+
+    def latency(self, agent_url: str, operation: str) -> RollingLatency:
+        key = (agent_url, operation)
+        latency = self._latencies.get(key)
+        if latency is None:
+            latency = self._latencies[key] = RollingLatency(self.window)
+        return latency
+
+    def timeout(self, agent_url: str, operation: str, ceiling: float) -> float:
+        latency = self.latency(agent_url, operation)
+        if len(latency) < self.min_samples:
+            return ceiling
+        (p99_ms,) = latency.percentiles(0.99)
+        if p99_ms is None:
+            return ceiling
+        adaptive = p99_ms / 1000 * self.multiplier
+        return min(ceiling, max(self.min_timeouts.get(operation, 0.0), adaptive))
+
+    @contextmanager
+    def guard(self, agent_url: str) -> Iterator[None]:
+        """Run the block under the agent's circuit breaker, without a timeout
+        of its own (e.g. opening a stream whose length says nothing)"""
+        breaker = self.breaker(agent_url)
+        if not breaker.allow():
+            raise CircuitOpenError(agent_url, breaker.retry_after())
+        try:
+            yield
+        except BaseException as e:
+            breaker.record_exception(e)
+            raise
+        breaker.record_success()
+
+    async def call(
+        self,
+        agent_url: str,
+        operation: str,
+        ceiling: float,
+        fn: Callable[[float], Awaitable[T]],
+    ) -> T:
+        """Run fn(timeout) under the agent's circuit breaker"""
+        with self.guard(agent_url):
+            timeout = self.timeout(agent_url, operation, ceiling)
+            start = time.perf_counter()
+            result = await fn(timeout)
+        self.latency(agent_url, operation).record((time.perf_counter() - start) * 1000)
+        return result
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            agent_url: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.failures,
+                "retry_after_s": round(breaker.retry_after(), 1)
+                if breaker.state == "open"
+                else 0.0,
+            }
+            for agent_url, breaker in self._breakers.items()
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import importlib.util
+import os
+from collections.abc import Callable
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+
+# Bodies smaller than this are sent as they are
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+# Low brotli qualities compress about like gzip -6 at a fraction of the CPU
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+# Larger bodies are compressed in a worker thread, off the event loop
+COMPRESSION_THREAD_MIN_SIZE = int(
+    os.environ.get("COMPRESSION_THREAD_MIN_SIZE", str(256 * 1024))
+)
+# Brotli needs the optional brotli package
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+# Streamed per event/line, compressing them would hold chunks back
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, the gateway's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls `on_close` once it is over, however it
+    ended; unlike a finally in the body generator, this also runs when the
+    client went away before the generator was started"""
+
+    def __init__(self, *args, on_close: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """Map each coding of an Accept-Encoding header to its q-value"""
+    codings = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            codings[coding.strip().lower()] = quality
+    return codings
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Preferred coding the client accepts: br, then gzip, else None"""
+    codings = parse_accept_encoding(accept_encoding)
+    supported = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+    accepted = [
+        coding
+        for coding in supported
+        if codings.get(coding, codings.get("*", 0.0)) > 0
+    ]
+    if not accepted:
+        return None
+    # highest q-value wins, ties go to the first (better) coding
+    return max(accepted, key=lambda c: codings.get(c, codings.get("*", 0.0)))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing whole responses with brotli or gzip.
+
+    Only single-message bodies of at least `min_size` bytes are compressed;
+    streamed responses (SSE, ndjson, deploy events) pass through untouched
+    so their chunks keep reaching the client as soon as they're produced.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            media_type = headers.get("content-type", "")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.min_size
+                or "content-encoding" in headers
+                or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+                body = await asyncio.to_thread(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
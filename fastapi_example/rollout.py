@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+
+import google.auth
+from google.auth.transport.requests import Request
+from google.cloud import run_v2
+
+from models import DeployRequestInner
+from upstream import UpstreamClientPool
+
+
+logger = logging.getLogger(__name__)
+
+
+# Service annotation holding the fingerprint of the deployed configuration
+CONFIG_HASH_ANNOTATION = os.environ.get(
+    "DEPLOY_CONFIG_HASH_ANNOTATION", "adk-gateway/config-hash"
+)
+# Timeout of the Artifact Registry manifest lookup
+IMAGE_DIGEST_TIMEOUT = float(os.environ.get("IMAGE_DIGEST_TIMEOUT", "10"))
+
+MANIFEST_MEDIA_TYPES = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+def stable_service_name(agent_name: str, user_email: str) -> str:
+    """Cloud Run service id that stays the same for a (user, agent) pair"""
+    user_hash = hashlib.sha256(user_email.lower().encode()).hexdigest()[:10]
+    # ids are lowercase letters, digits and dashes, max 49 chars
+    agent = re.sub(r"[^a-z0-9-]", "-", agent_name.lower()).strip("-")
+    return f"{agent[:38]}-{user_hash}"
+
+
+def split_image(image: str) -> tuple[str, str]:
+    """Split host/path:tag (or host/path@digest) into repository and reference"""
+    if "@" in image:
+        repository, reference = image.split("@", 1)
+        return repository, reference
+    repository, _, tag = image.rpartition(":")
+    if not repository or "/" in tag:
+        return image, "latest"
+    return repository, tag
+
+
+_credentials = None
+
+
+def get_access_token() -> str:
+    """Blocking fetch of an OAuth access token from ADC, cached until expiry"""
+    global _credentials
+    if _credentials is None:
+        _credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+    if not _credentials.valid:
+        _credentials.refresh(Request())
+    return _credentials.token
+
+
+async def resolve_image_digest(pool: UpstreamClientPool, image: str) -> str | None:
+    """Ask the registry which digest a tag points at, None if unknown"""
+    repository, reference = split_image(image)
+    if reference.startswith("sha256:"):
+        return reference
+    host, _, path = repository.partition("/")
+    url = f"https://{host}/v2/{path}/manifests/{reference}"
+    try:
+        token = await asyncio.to_thread(get_access_token)
+        response = await pool.get(url).head(
+            url,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": MANIFEST_MEDIA_TYPES,
+            },
+            timeout=IMAGE_DIGEST_TIMEOUT,
+        )
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning(f"Could not resolve digest of {image}: {e}")
+        return None
+    return response.headers.get("Docker-Content-Digest")
+
+
+def pin_image(image: str, digest: str | None) -> str:
+    """Reference the image by digest so a revision never drifts with its tag"""
+    if not digest:
+        return image
+    repository, _ = split_image(image)
+    return f"{repository}@{digest}"
+
+
+def config_fingerprint(request: DeployRequestInner, image: str) -> str:
+    """Hash of everything that ends up in the revision template"""
+    config = request.model_dump(
+        include={
+            "env_vars",
+            "timeout",
+            "memory",
+            "network",
+            "subnet",
+            "min_instances",
+            "cpu_boost",
+            "concurrency",
+        }
+    )
+    config["image"] = image
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def revision_id(revision: str) -> str:
+    """Short revision name from its full resource name"""
+    return revision.rsplit("/", 1)[-1]
+
+
+def serves_latest(service: run_v2.Service) -> bool:
+    """Whether all traffic goes to the latest revision, and it is ready"""
+    latest = run_v2.TrafficTargetAllocationType.TRAFFIC_TARGET_ALLOCATION_TYPE_LATEST
+    return (
+        service.latest_ready_revision == service.latest_created_revision
+        and [t.percent for t in service.traffic if t.type_ == latest] == [100]
+    )
+
+
+def traffic_split(percent: int, previous: str | None) -> list[run_v2.TrafficTarget]:
+    """Send percent of the traffic to the latest revision, the rest to previous"""
+    allocation = run_v2.TrafficTargetAllocationType
+    targets = [
+        run_v2.TrafficTarget(
+            type_=allocation.TRAFFIC_TARGET_ALLOCATION_TYPE_LATEST, percent=percent
+        )
+    ]
+    if previous and percent < 100:
+        targets.append(
+            run_v2.TrafficTarget(
+                type_=allocation.TRAFFIC_TARGET_ALLOCATION_TYPE_REVISION,
+                revision=revision_id(previous),
+                percent=100 - percent,
+            )
+        )
+    return targets
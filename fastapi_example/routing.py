@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import httpx
+
+from resilience import CircuitOpenError, UpstreamError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Weight of the newest sample in a replica's latency average
+REPLICA_EWMA_ALPHA = float(os.environ.get("REPLICA_EWMA_ALPHA", "0.3"))
+# Consecutive failed calls that take a replica out of rotation
+REPLICA_EJECT_FAILURES = int(os.environ.get("REPLICA_EJECT_FAILURES", "3"))
+# Seconds between health probes of an ejected replica
+REPLICA_PROBE_INTERVAL = float(os.environ.get("REPLICA_PROBE_INTERVAL", "10"))
+REPLICA_PROBE_TIMEOUT = float(os.environ.get("REPLICA_PROBE_TIMEOUT", "10"))
+
+
+Probe = Callable[[str], Awaitable[None]]
+
+
+def is_replica_failure(exc: BaseException) -> bool:
+    """Whether the error says something is wrong with the replica itself"""
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(exc, CircuitOpenError):
+        return True
+    return isinstance(exc, UpstreamError) and exc.is_failure
+
+
+@dataclass
+class ReplicaStats:
+    ewma_ms: float | None = None
+    in_flight: int = 0
+    failures: int = 0
+    ejected: bool = False
+
+
+class ReplicaRouter:
+    """Picks one of an agent's replica urls per call.
+
+    Power of two choices: two random replicas are compared by EWMA latency
+    times (in-flight calls + 1) and the cheaper one wins, which keeps load
+    off slow or busy replicas without herding onto a single best one.
+    A replica failing `eject_failures` calls in a row is ejected and then
+    probed in the background until it answers again.
+    """
+
+    def __init__(
+        self,
+        probe: Probe,
+        alpha: float = REPLICA_EWMA_ALPHA,
+        eject_failures: int = REPLICA_EJECT_FAILURES,
+        probe_interval: float = REPLICA_PROBE_INTERVAL,
+        probe_timeout: float = REPLICA_PROBE_TIMEOUT,
+        rng: random.Random | None = None,
+    ):
+        self.probe = probe
+        self.alpha = alpha
+        self.eject_failures = eject_failures
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.rng = rng or random.Random()
+        self._stats: dict[str, ReplicaStats] = {}
+        self._probes: dict[str, asyncio.Task] = {}
+
+    def stats(self, agent_url: str) -> ReplicaStats:
+        stats = self._stats.get(agent_url)
+        if stats is None:
+            stats = self._stats[agent_url] = ReplicaStats()
+        return stats
+
+    def score(self, agent_url: str, default_ms: float = 1.0) -> float:
+        stats = self.stats(agent_url)
+        latency = stats.ewma_ms if stats.ewma_ms is not None else default_ms
+        return latency * (stats.in_flight + 1)
+
+    def pick(self, agent_urls: list[str]) -> str:
+        """Choose a replica; ejected ones only when nothing else is left"""
+        candidates = [
+            agent_url for agent_url in agent_urls if not self.stats(agent_url).ejected
+        ] or list(agent_urls)
+        if len(candidates) == 1:
+            return candidates[0]
+
+        # replicas without samples yet look like an average one
+        known = [
+            self._stats[url].ewma_ms
+            for url in candidates
+            if self._stats[url].ewma_ms is not None
+        ]
+        default_ms = sum(known) / len(known) if known else 1.0
+        first, second = self.rng.sample(candidates, 2)
+        if self.score(first, default_ms) <= self.score(second, default_ms):
+            return first
+        return second
+
+    @contextmanager
+    def track(self, agent_url: str, sample_latency: bool = True):
+        """Account one call to the replica: in-flight, latency and failures.
+
+        Calls whose duration isn't comparable to a /run (sessions, streams)
+        pass sample_latency=False and only count towards load and failures.
+        """
+        stats = self.stats(agent_url)
+        stats.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            if is_replica_failure(e):
+                self.record_failure(agent_url)
+            raise
+        else:
+            if sample_latency:
+                self.record_success(agent_url, (time.perf_counter() - start) * 1000)
+            else:
+                stats.failures = 0
+        finally:
+            stats.in_flight -= 1
+
+    def record_success(self, agent_url: str, latency_ms: float):
+        stats = self.stats(agent_url)
+        stats.failures = 0
+        if stats.ewma_ms is None:
+            stats.ewma_ms = latency_ms
+        else:
+            stats.ewma_ms += self.alpha * (latency_ms - stats.ewma_ms)
+
+    def record_failure(self, agent_url: str):
+        stats = self.stats(agent_url)
+        stats.failures += 1
+        if not stats.ejected and stats.failures >= self.eject_failures:
+            logger.warning(
+                f"Ejecting replica {agent_url} after {stats.failures} failures"
+            )
+            stats.ejected = True
+            self._probes[agent_url] = asyncio.create_task(
+                self._probe_until_up(agent_url)
+            )
+
+    def restore(self, agent_url: str):
+        stats = self.stats(agent_url)
+        if stats.ejected:
+            logger.info(f"Replica {agent_url} is healthy again")
+        stats.ejected = False
+        stats.failures = 0
+        # its old latency says little about the recovered instance
+        stats.ewma_ms = None
+
+    async def _probe_until_up(self, agent_url: str):
+        try:
+            while True:
+                await asyncio.sleep(self.probe_interval)
+                try:
+                    await asyncio.wait_for(self.probe(agent_url), self.probe_timeout)
+                except Exception as e:
+                    logger.info(f"Ejected replica {agent_url} still failing: {e}")
+                    continue
+                self.restore(agent_url)
+                return
+        finally:
+            self._probes.pop(agent_url, None)
+
+    async def aclose(self):
+        """Cancel the probes of ejected replicas, called on app shutdown"""
+        tasks = list(self._probes.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            agent_url: {
+                "ewma_ms": None if stats.ewma_ms is None else round(stats.ewma_ms, 1),
+                "in_flight": stats.in_flight,
+                "consecutive_failures": stats.failures,
+                "ejected": stats.ejected,
+            }
+            for agent_url, stats in self._stats.items()
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+# Pre-created sessions kept ready per (agent url, agent, user)
+SESSION_POOL_SIZE = int(os.environ.get("SESSION_POOL_SIZE", "2"))
+# Sessions remembered as existing on the agent side
+KNOWN_SESSIONS_MAX = int(os.environ.get("KNOWN_SESSIONS_MAX", "10000"))
+
+
+PoolKey = tuple[str, str, str]  # (agent_url, agent_name, user_id)
+SessionCreator = Callable[[str, str, str], Awaitable[str]]
+
+
+class KnownSessionCache:
+    """LRU of sessions known to exist, mapped to the agent url holding them"""
+
+    def __init__(self, max_size: int = KNOWN_SESSIONS_MAX):
+        self.max_size = max_size
+        self._sessions: OrderedDict[tuple[str, str, str], str] = OrderedDict()
+
+    def get(self, user_email: str, agent_name: str, session_id: str) -> str | None:
+        key = (user_email, agent_name, session_id)
+        agent_url = self._sessions.get(key)
+        if agent_url is not None:
+            self._sessions.move_to_end(key)
+        return agent_url
+
+    def add(self, user_email: str, agent_name: str, session_id: str, agent_url: str):
+        key = (user_email, agent_name, session_id)
+        self._sessions[key] = agent_url
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+
+    def discard(self, user_email: str, agent_name: str, session_id: str):
+        self._sessions.pop((user_email, agent_name, session_id), None)
+
+    def discard_url(self, agent_url: str):
+        """Forget every session held by the agent url, e.g. after a redeploy"""
+        for key in [key for key, url in self._sessions.items() if url == agent_url]:
+            del self._sessions[key]
+
+
+class SessionPool:
+    """Sessions created ahead of time so a new conversation can start at once.
+
+    `take` hands out a ready session (or None when the pool is empty) and
+    schedules a background refill through `creator`, which creates a session
+    on the agent and returns its id.
+    """
+
+    def __init__(self, creator: SessionCreator, size: int = SESSION_POOL_SIZE):
+        self.creator = creator
+        self.size = size
+        self._ready: dict[PoolKey, deque[str]] = {}
+        self._refills: dict[PoolKey, asyncio.Task] = {}
+
+    def take(self, agent_url: str, agent_name: str, user_id: str) -> str | None:
+        key = (agent_url, agent_name, user_id)
+        ready = self._ready.get(key)
+        session_id = ready.popleft() if ready else None
+        self.refill(agent_url, agent_name, user_id)
+        return session_id
+
+    def refill(self, agent_url: str, agent_name: str, user_id: str):
+        """Top the pool up in the background, one refill per key at a time"""
+        key = (agent_url, agent_name, user_id)
+        if self.size <= 0 or key in self._refills:
+            return
+        if len(self._ready.get(key, ())) >= self.size:
+            return
+        task = asyncio.create_task(self._refill(key))
+        self._refills[key] = task
+        task.add_done_callback(lambda _: self._refills.pop(key, None))
+
+    def discard_url(self, agent_url: str):
+        """Drop the ready sessions on the agent url, the agent lost them"""
+        for key in [key for key in self._ready if key[0] == agent_url]:
+            del self._ready[key]
+        for key, task in list(self._refills.items()):
+            if key[0] == agent_url:
+                task.cancel()
+
+    async def _refill(self, key: PoolKey):
+        ready = self._ready.setdefault(key, deque())
+        while len(ready) < self.size:
+            try:
+                session_id = await self.creator(*key)
+            except Exception as e:
+                logger.warning(f"Session pre-provisioning for {key} failed: {e}")
+                return
+            ready.append(session_id)
+
+    async def aclose(self):
+        """Cancel pending refills, called on app shutdown"""
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,62 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The call runs in its own task and callers await it through a shield, so
+    one caller going away (e.g. client disconnect) does not cancel the
+    upstream request for the others. Once every caller has gone, nobody
+    needs the result and the call is cancelled.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable | None, fn: Callable[[], Awaitable[Any]]):
+        """Run fn, or join the running call for key; None key disables sharing"""
+        if key is None:
+            return await fn()
+
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.started += 1
+        else:
+            self.shared += 1
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._leave(key, task)
+
+    def _leave(self, key: Hashable, task: asyncio.Task):
+        waiters = self._waiters[task] - 1
+        if waiters:
+            self._waiters[task] = waiters
+            return
+        del self._waiters[task]
+        if not task.done():
+            # the last caller went away; later callers start a new call
+            # rather than join one that is being cancelled
+            if self._calls.get(key) is task:
+                del self._calls[key]
+            task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # mark the exception retrieved when every caller went away
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+import threading
+
+import httpx
+import pytest
+
+import main
+from auth import IdTokenProvider, get_token_expiry
+from resilience import UpstreamError
+
+
+AUDIENCE = "https://agent.example"
+
+
+def make_jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).rstrip(b"=")
+    return f"header.{payload.decode()}.signature"
+
+
+class FakeFetcher:
+    """Fake token source: numbered tokens, blocks while `gate` is closed"""
+
+    def __init__(self, lifetime: float | None = None, clock=None):
+        self.lifetime = lifetime
+        self.clock = clock
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.error: Exception | None = None
+
+    def __call__(self, audience: str) -> str:
+        self.gate.wait(5)
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if self.lifetime is None:
+            return f"token-{self.calls}"
+        return make_jwt(self.clock() + self.lifetime) + f"-{self.calls}"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+def test_expiry_comes_from_the_exp_claim():
+    assert get_token_expiry(make_jwt(1234)) == 1234
+    assert get_token_expiry("not-a-jwt") is None
+    assert get_token_expiry("a.b.c") is None
+
+
+def test_token_is_cached_per_audience():
+    async def scenario():
+        fetcher = FakeFetcher()
+        provider = IdTokenProvider(fetcher=fetcher)
+        assert await provider.get_token(AUDIENCE) == "token-1"
+        assert await provider.get_token(AUDIENCE) == "token-1"
+        assert await provider.get_token("https://other.example") == "token-2"
+        assert fetcher.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_callers_share_one_fetch():
+    async def scenario():
+        fetcher = FakeFetcher()
+        fetcher.gate.clear()
+        provider = IdTokenProvider(fetcher=fetcher)
+        waiters = [asyncio.create_task(provider.get_token(AUDIENCE)) for _ in range(20)]
+        await settle()
+        fetcher.gate.set()
+
+        assert await asyncio.gather(*waiters) == ["token-1"] * 20
+        assert fetcher.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_token_close_to_expiry_is_served_while_refreshed_behind():
+    async def scenario():
+        clock = Clock()
+        fetcher = FakeFetcher(lifetime=3600, clock=clock)
+        provider = IdTokenProvider(fetcher=fetcher, refresh_margin=300, clock=clock)
+        first = await provider.get_token(AUDIENCE)
+
+        clock.now += 3400  # inside the refresh margin, still valid
+        fetcher.gate.clear()
+        assert await provider.get_token(AUDIENCE) == first
+        fetcher.gate.set()
+        await settle()
+
+        second = await provider.get_token(AUDIENCE)
+        assert second != first and second.endswith("-2")
+        assert fetcher.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_expired_token_is_fetched_again():
+    async def scenario():
+        clock = Clock()
+        fetcher = FakeFetcher(lifetime=3600, clock=clock)
+        provider = IdTokenProvider(fetcher=fetcher, refresh_margin=0, clock=clock)
+        await provider.get_token(AUDIENCE)
+        clock.now += 3600
+        assert (await provider.get_token(AUDIENCE)).endswith("-2")
+
+    asyncio.run(scenario())
+
+
+def test_token_without_exp_lives_the_default_lifetime():
+    async def scenario():
+        clock = Clock()
+        provider = IdTokenProvider(
+            fetcher=FakeFetcher(), refresh_margin=0, default_lifetime=60, clock=clock
+        )
+        await provider.get_token(AUDIENCE)
+        clock.now += 59
+        assert await provider.get_token(AUDIENCE) == "token-1"
+        clock.now += 1
+        assert await provider.get_token(AUDIENCE) == "token-2"
+
+    asyncio.run(scenario())
+
+
+def test_failed_fetch_reaches_the_caller_and_is_retried():
+    async def scenario():
+        fetcher = FakeFetcher()
+        fetcher.error = RuntimeError("metadata server down")
+        provider = IdTokenProvider(fetcher=fetcher)
+        with pytest.raises(RuntimeError):
+            await provider.get_token(AUDIENCE)
+
+        fetcher.error = None
+        assert await provider.get_token(AUDIENCE) == "token-2"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_fetch():
+    async def scenario():
+        fetcher = FakeFetcher()
+        fetcher.gate.clear()
+        provider = IdTokenProvider(fetcher=fetcher)
+        leaving = asyncio.create_task(provider.get_token(AUDIENCE))
+        staying = asyncio.create_task(provider.get_token(AUDIENCE))
+        await settle()
+        leaving.cancel()
+        fetcher.gate.set()
+
+        assert await staying == "token-1"
+        assert fetcher.calls == 1
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("status_code", [401, 403])
+def test_rejected_token_is_dropped_from_the_cache(monkeypatch, status_code):
+    async def scenario():
+        fetcher = FakeFetcher()
+        provider = IdTokenProvider(fetcher=fetcher)
+        monkeypatch.setattr(main, "token_provider", provider)
+        assert await provider.get_token(AUDIENCE) == "token-1"
+
+        response = httpx.Response(status_code, text="invalid token")
+        with pytest.raises(UpstreamError):
+            main.raise_for_upstream(response, AUDIENCE)
+        assert await provider.get_token(AUDIENCE) == "token-2"
+
+        # other errors keep the token
+        with pytest.raises(UpstreamError):
+            main.raise_for_upstream(httpx.Response(500), AUDIENCE)
+        assert await provider.get_token(AUDIENCE) == "token-2"
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+from deploy_jobs import DeployJobManager, DeployJobStore, StoredDeployJob
+from models import DeployRequestInner, DeployResponse
+
+
+class BlockingRunner:
+    """Fake deploy: reports progress, finishes when released"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def __call__(self, request, user_email, progress):
+        progress("Creating revision")
+        await self.release.wait()
+        return DeployResponse(
+            status="Deployed", unique_service_name=request.agent_name, url="https://a"
+        )
+
+
+def make_manager(path, runner, **kwargs):
+    settings = dict(workers=1, heartbeat_interval=0.01, stale_after=0.1)
+    settings.update(kwargs)
+    return DeployJobManager(runner=runner, store=DeployJobStore(path), **settings)
+
+
+async def collect(job) -> list[str]:
+    return [event.status async for event in job.follow()]
+
+
+def test_store_is_opened_on_start_not_construction(tmp_path):
+    path = str(tmp_path / "deploy_jobs.db")
+
+    async def scenario():
+        manager = make_manager(path, BlockingRunner())
+        assert not os.path.exists(path)
+        manager.start()
+        assert os.path.exists(path)
+        await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_other_worker_follows_the_job_to_the_end(tmp_path):
+    path = str(tmp_path / "deploy_jobs.db")
+
+    async def scenario():
+        runner = BlockingRunner()
+        owner, other = make_manager(path, runner), make_manager(path, runner)
+        owner.start()
+        other.start()
+        job = owner.submit(DeployRequestInner(agent_name="rag"), user_email="u")
+        await asyncio.sleep(0.02)
+
+        stored = other.get(job.status.job_id)
+        assert isinstance(stored, StoredDeployJob)
+        stored.poll_interval = 0.01
+        following = asyncio.create_task(collect(stored))
+        # the owner's heartbeat keeps a long deploy from looking stale
+        await asyncio.sleep(0.3)
+        assert not following.done()
+        assert other.get(job.status.job_id).status.status == "running"
+
+        runner.release.set()
+        statuses = await asyncio.wait_for(following, 1)
+        assert statuses[0] == "queued" and statuses[-1] == "succeeded"
+        assert other.get(job.status.job_id).status.url == "https://a"
+        await owner.stop()
+        await other.stop()
+
+    asyncio.run(scenario())
+
+
+def test_job_of_a_dead_worker_is_failed_instead_of_followed_forever(tmp_path):
+    path = str(tmp_path / "deploy_jobs.db")
+
+    async def scenario():
+        owner = make_manager(path, BlockingRunner())
+        other = make_manager(path, BlockingRunner())
+        owner.start()
+        other.start()
+        job = owner.submit(DeployRequestInner(agent_name="rag"), user_email="u")
+        await asyncio.sleep(0.02)
+        await owner.stop()  # the worker is gone, its job still says running
+
+        stored = other.get(job.status.job_id)
+        assert stored.status.status == "running"
+        stored.poll_interval = 0.01
+        statuses = await asyncio.wait_for(collect(stored), 1)
+
+        assert statuses[-1] == "failed"
+        status = other.get(job.status.job_id).status
+        assert (status.status, status.message) == (
+            "failed",
+            "Failed: the gateway worker running it stopped",
+        )
+        await other.stop()
+
+    asyncio.run(scenario())
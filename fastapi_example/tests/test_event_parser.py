@@ -0,0 +1,141 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from event_parser import EventArrayDecoder, parse_event, parse_part
+
+
+# ADK Events serialized the way its api server answers /run (by alias,
+# without None fields); non-ASCII text puts multi-byte characters in it
+RUN_RESPONSE = (Path(__file__).parent / "data" / "adk_run_response.json").read_bytes()
+
+
+def decode(chunks) -> list[dict]:
+    decoder = EventArrayDecoder()
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    events.extend(decoder.close())
+    return events
+
+
+def test_run_response_split_at_every_byte_offset():
+    expected = json.loads(RUN_RESPONSE)
+    for offset in range(len(RUN_RESPONSE) + 1):
+        chunks = [RUN_RESPONSE[:offset], RUN_RESPONSE[offset:]]
+        assert decode(chunks) == expected, offset
+
+
+def test_run_response_one_byte_at_a_time():
+    chunks = [RUN_RESPONSE[i : i + 1] for i in range(len(RUN_RESPONSE))]
+    assert decode(chunks) == json.loads(RUN_RESPONSE)
+
+
+def test_pretty_printed_array_split_at_every_offset():
+    body = json.dumps(json.loads(RUN_RESPONSE)[:2], indent=2, ensure_ascii=False)
+    expected = json.loads(body)
+    for offset in range(len(body) + 1):
+        assert decode([body[:offset], body[offset:]]) == expected, offset
+
+
+def test_events_are_returned_by_the_chunk_that_completes_them():
+    events = json.loads(RUN_RESPONSE)
+    first, second = (json.dumps(event).encode() for event in events[:2])
+    decoder = EventArrayDecoder()
+
+    assert decoder.feed(b"[" + first[:10]) == []
+    assert decoder.feed(first[10:] + b"," + second[:10]) == [events[0]]
+    assert decoder.feed(second[10:] + b"]") == [events[1]]
+    assert decoder.close() == []
+    assert decoder.feed(b"trailing") == []
+
+
+def test_large_event_in_small_chunks():
+    event = {"author": "root_agent", "content": {"parts": [{"text": "x" * 100_000}]}}
+    body = json.dumps([event, event]).encode()
+    chunks = [body[i : i + 100] for i in range(0, len(body), 100)]
+    assert decode(chunks) == [event, event]
+
+
+@pytest.mark.parametrize("body", [b"[]", b" \n[ ] ", b"[\n]"])
+def test_empty_arrays(body):
+    assert decode([body]) == []
+
+
+@pytest.mark.parametrize("body", [b"", b"[", RUN_RESPONSE[:-1], b'[{"a": 1},'])
+def test_truncated_body_fails_on_close(body):
+    with pytest.raises(ValueError):
+        decode([body])
+
+
+def test_body_that_is_not_an_array_fails():
+    with pytest.raises(ValueError):
+        decode([b'{"error": "not found"}'])
+
+
+def test_parse_event_returns_every_part_of_the_run_response():
+    parts = [
+        part for event in json.loads(RUN_RESPONSE) for part in parse_event(event)
+    ]
+    assert [part.kind for part in parts] == [
+        "thought",
+        "function_call",
+        "function_response",
+        "executable_code",
+        "code_execution_result",
+        "file",
+        "file",
+        "text",
+    ]
+    assert {part.agent_name for part in parts} == {"root_agent"}
+    assert parts[-1].text == "Morning: Lindenhof 🌞, afternoon: the lake — enjoy!"
+
+
+def test_user_events_and_events_without_content_are_skipped():
+    assert parse_event({"author": "user", "content": {"parts": [{"text": "hi"}]}}) == []
+    assert parse_event({"author": "root_agent"}) == []
+    assert parse_event({"author": "root_agent", "content": {"parts": None}}) == []
+
+
+@pytest.mark.parametrize(
+    "part, kind, data",
+    [
+        ({"functionCall": {"name": "f", "args": {}}}, "function_call", None),
+        ({"function_call": {"name": "f", "args": {}}}, "function_call", None),
+        ({"functionResponse": {"name": "f"}}, "function_response", None),
+        ({"function_response": {"name": "f"}}, "function_response", None),
+        ({"executableCode": {"code": "1"}}, "executable_code", None),
+        ({"executable_code": {"code": "1"}}, "executable_code", None),
+        ({"codeExecutionResult": {"output": "1"}}, "code_execution_result", None),
+        ({"code_execution_result": {"output": "1"}}, "code_execution_result", None),
+        ({"fileData": {"fileUri": "gs://b/f"}}, "file", None),
+        ({"file_data": {"file_uri": "gs://b/f"}}, "file", None),
+        (
+            {"inlineData": {"mimeType": "image/png", "data": "iVBORw0K"}},
+            "file",
+            {"mimeType": "image/png"},
+        ),
+        (
+            {"inline_data": {"mime_type": "image/png", "data": "iVBORw0K"}},
+            "file",
+            {"mime_type": "image/png"},
+        ),
+    ],
+)
+def test_parse_part_kinds(part, kind, data):
+    answer_part = parse_part("agent", part)
+    assert answer_part.kind == kind
+    assert answer_part.data == (data or next(iter(part.values())))
+    assert answer_part.text == ""
+
+
+def test_parse_part_text_and_thought():
+    text = parse_part("agent", {"text": "hello"})
+    assert (text.kind, text.text, text.data) == ("text", "hello", None)
+    assert parse_part("agent", {"text": "hmm", "thought": True}).kind == "thought"
+    assert parse_part("agent", {"text": "hmm", "thought": False}).kind == "text"
+
+
+def test_parse_part_unknown_kind():
+    assert parse_part("agent", {"videoMetadata": {}}) is None
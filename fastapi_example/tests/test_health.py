@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from health import AgentHealthMonitor
+
+
+URL = "https://agent.example"
+
+
+class FakeProbe:
+    """Fake health probe: fails while `failing`, counts every call"""
+
+    def __init__(self):
+        self.calls = []
+        self.failing = False
+
+    async def __call__(self, agent_url: str):
+        self.calls.append(agent_url)
+        if self.failing:
+            raise RuntimeError("probe failed")
+
+
+def make_monitor(probe, **kwargs):
+    targets = [("user@example.com", "rag", URL), ("user@example.com", "other", "local")]
+    return AgentHealthMonitor(
+        list_targets=lambda: targets,
+        probe=probe,
+        failure_threshold=2,
+        recovery_interval=0.01,
+        **kwargs,
+    )
+
+
+def fail_call(monitor, error=None):
+    with pytest.raises(Exception):
+        with monitor.track(URL):
+            raise error or RuntimeError("upstream failed")
+
+
+def test_no_sweep_by_default_and_unseen_urls_are_unknown():
+    async def scenario():
+        probe = FakeProbe()
+        monitor = AgentHealthMonitor(list_targets=lambda: [("u", "rag", URL)], probe=probe)
+        monitor.start()
+        await asyncio.sleep(0.01)
+        await monitor.stop()
+
+        assert probe.calls == []
+        [health] = monitor.snapshot()
+        assert (health.agent_url, health.status, health.samples) == (URL, "unknown", 0)
+
+    asyncio.run(scenario())
+
+
+def test_real_calls_are_the_health_checks():
+    async def scenario():
+        probe = FakeProbe()
+        monitor = make_monitor(probe)
+        with monitor.track(URL):
+            pass
+        with monitor.track(URL, sample_latency=False):
+            pass
+
+        [health] = monitor.snapshot()
+        assert (health.status, health.samples, health.agent_names) == ("up", 1, ["rag"])
+        assert probe.calls == []
+
+    asyncio.run(scenario())
+
+
+def test_errors_that_are_not_failures_are_not_counted():
+    async def scenario():
+        monitor = make_monitor(FakeProbe(), is_failure=lambda e: isinstance(e, OSError))
+        for _ in range(3):
+            fail_call(monitor, ValueError("bad request"))
+
+        assert not monitor.is_down(URL)
+        assert monitor.snapshot()[0].status == "unknown"
+
+    asyncio.run(scenario())
+
+
+def test_only_a_down_url_is_probed_until_it_recovers():
+    async def scenario():
+        probe = FakeProbe()
+        probe.failing = True
+        monitor = make_monitor(probe)
+        fail_call(monitor)
+        await asyncio.sleep(0.03)
+        assert probe.calls == []  # failing once is not down yet
+
+        fail_call(monitor)
+        assert monitor.is_down(URL)
+        await asyncio.sleep(0.03)
+        assert probe.calls and monitor.snapshot()[0].status == "down"
+
+        probe.failing = False
+        await asyncio.sleep(0.05)
+        assert not monitor.is_down(URL)
+        probes = len(probe.calls)
+        await asyncio.sleep(0.03)
+        assert len(probe.calls) == probes  # back up, no more probes
+        await monitor.stop()
+
+    asyncio.run(scenario())
+
+
+def test_opt_in_sweep_probes_every_registered_url():
+    async def scenario():
+        probe = FakeProbe()
+        monitor = make_monitor(probe, interval=60)
+        monitor.start()
+        await asyncio.sleep(0.01)
+        await monitor.stop()
+
+        assert probe.calls == [URL]  # the non-http "local" url is skipped
+        assert monitor.snapshot()[0].status == "up"
+
+    asyncio.run(scenario())
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from hedging import HedgeBudget, Hedger
+from models import QueryRequest
+
+
+class SlowCall:
+    """Fake /run: answers after `seconds`, or raises `error` then"""
+
+    def __init__(self, seconds: float, result="answer", error=None):
+        self.seconds = seconds
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def make_hedger(latency_ms=10, **kwargs):
+    """Hedger for "rag" at p50, already knowing `latency_ms` calls"""
+    settings = dict(percentiles={"rag": 50}, min_samples=5, budget_burst=10)
+    settings.update(kwargs)
+    hedger = Hedger(**settings)
+    for _ in range(5):
+        hedger.latency("rag").record(latency_ms)
+    return hedger
+
+
+def test_budget_allows_a_burst_then_the_ratio_of_traffic():
+    budget = HedgeBudget(ratio=0.25, burst=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+    for _ in range(3):
+        budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()  # one hedge per four queries
+
+    for _ in range(100):
+        budget.deposit()
+    assert budget.tokens == 2
+
+
+def test_only_session_less_queries_of_listed_agents_are_hedged():
+    hedger = Hedger(percentiles={"rag": 95})
+    auth = {"user_email": "u", "agent_name": "rag"}
+    assert hedger.enabled(QueryRequest(auth=auth, query="q"))
+    in_session = QueryRequest(auth=auth, query="q", current_session_id="s")
+    assert not hedger.enabled(in_session)
+    other = {"user_email": "u", "agent_name": "other"}
+    assert not hedger.enabled(QueryRequest(auth=other, query="q"))
+
+
+def test_no_hedge_until_there_are_enough_samples():
+    async def scenario():
+        hedger = Hedger(percentiles={"rag": 50}, min_samples=5)
+        primary, backup = SlowCall(0.05), SlowCall(0)
+        assert hedger.delay("rag") is None
+        assert await hedger.run("rag", primary, backup) == "answer"
+        assert backup.calls == 0
+
+    asyncio.run(scenario())
+
+
+def test_fast_primary_is_not_hedged():
+    async def scenario():
+        hedger = make_hedger(latency_ms=50)
+        primary, backup = SlowCall(0, "primary"), SlowCall(0, "backup")
+        assert await hedger.run("rag", primary, backup) == "primary"
+        assert backup.calls == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10)
+        primary, backup = SlowCall(1, "primary"), SlowCall(0, "backup")
+        result = await asyncio.wait_for(hedger.run("rag", primary, backup), 0.5)
+        assert result == "backup"
+        assert (backup.calls, primary.cancelled) == (1, 1)
+        assert hedger.budget("rag").tokens == 9  # full bucket, one hedge taken
+
+    asyncio.run(scenario())
+
+
+def test_primary_can_still_win_after_the_hedge():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10)
+        primary, backup = SlowCall(0.03, "primary"), SlowCall(1, "backup")
+        assert await hedger.run("rag", primary, backup) == "primary"
+        assert backup.cancelled == 1
+
+    asyncio.run(scenario())
+
+
+def test_over_budget_waits_for_the_primary():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10, budget_burst=0, budget_ratio=0)
+        primary, backup = SlowCall(0.03, "primary"), SlowCall(0, "backup")
+        assert await hedger.run("rag", primary, backup) == "primary"
+        assert backup.calls == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_call_leaves_the_other_one_to_answer():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10)
+        primary = SlowCall(0.03, error=RuntimeError("primary failed"))
+        backup = SlowCall(0.05, "backup")
+        assert await hedger.run("rag", primary, backup) == "backup"
+
+    asyncio.run(scenario())
+
+
+def test_first_error_is_raised_when_both_calls_fail():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10)
+        primary = SlowCall(0.03, error=RuntimeError("primary failed"))
+        backup = SlowCall(0.05, error=RuntimeError("backup failed"))
+        with pytest.raises(RuntimeError, match="primary failed"):
+            await hedger.run("rag", primary, backup)
+
+    asyncio.run(scenario())
+
+
+def test_early_errors_are_not_hedged():
+    async def scenario():
+        hedger = make_hedger(latency_ms=50)
+        primary = SlowCall(0, error=RuntimeError("404"))
+        backup = SlowCall(0, "backup")
+        with pytest.raises(RuntimeError):
+            await hedger.run("rag", primary, backup)
+        assert backup.calls == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_query_cancels_both_calls():
+    async def scenario():
+        hedger = make_hedger(latency_ms=10)
+        primary, backup = SlowCall(1), SlowCall(1)
+        query = asyncio.create_task(hedger.run("rag", primary, backup))
+        await asyncio.sleep(0.05)
+        query.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await query
+        assert (primary.cancelled, backup.cancelled) == (1, 1)
+
+    asyncio.run(scenario())
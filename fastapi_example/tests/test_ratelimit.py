@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from ratelimit import RateLimited, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Frozen time.time() for the buckets, advanced by the test"""
+    now = [1000.0]
+    monkeypatch.setattr("ratelimit.time.time", lambda: now[0])
+    return now
+
+
+def make_limiter(path, **kwargs):
+    settings = dict(
+        user_per_minute=0,
+        user_burst=60,
+        agent_per_minute=0,
+        agent_burst=30,
+        agent_rates={},
+        agent_bursts={},
+        agent_costs={},
+    )
+    settings.update(kwargs)
+    limiter = RateLimiter(str(path / "rate_limits.db"), **settings)
+    limiter.open()
+    return limiter
+
+
+def test_database_is_created_on_open_not_construction(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "rate_limits.db"))
+    assert not os.path.exists(tmp_path / "rate_limits.db")
+    limiter.close()
+
+
+def test_no_limit_configured_takes_nothing(tmp_path):
+    limiter = make_limiter(tmp_path)
+    try:
+        assert limiter.take("u", "rag") is None
+        assert asyncio.run(limiter.check("u", "rag")) is None
+    finally:
+        limiter.close()
+
+
+def test_burst_then_rejected_with_retry_after(tmp_path):
+    limiter = make_limiter(tmp_path, agent_per_minute=60, agent_burst=3)
+    try:
+        remaining = [limiter.take("u", "rag").remaining for _ in range(3)]
+        assert remaining == [2, 1, 0]
+
+        result = limiter.take("u", "rag")
+        assert not result.allowed
+        assert result.retry_after == 1  # one token a second
+        assert result.headers()["Retry-After"] == "1"
+        # another user's bucket is untouched
+        assert limiter.take("v", "rag").allowed
+    finally:
+        limiter.close()
+
+
+def test_tokens_refill_over_time(tmp_path, clock):
+    limiter = make_limiter(tmp_path, agent_per_minute=60, agent_burst=2)
+    try:
+        limiter.take("u", "rag")
+        limiter.take("u", "rag")
+        assert not limiter.take("u", "rag").allowed
+        clock[0] += 1.5
+        assert limiter.take("u", "rag").allowed
+        assert not limiter.take("u", "rag").allowed
+    finally:
+        limiter.close()
+
+
+def test_a_query_that_does_not_fit_takes_from_neither_bucket(tmp_path):
+    limiter = make_limiter(
+        tmp_path,
+        user_per_minute=60,
+        user_burst=10,
+        agent_per_minute=60,
+        agent_bursts={"short_movie": 5},
+        agent_costs={"short_movie": 4},
+    )
+    try:
+        assert limiter.take("u", "short_movie").allowed  # agent bucket 5 -> 1
+        assert not limiter.take("u", "short_movie").allowed
+        # the rejected query left the user bucket at 6 for other agents
+        results = [limiter.take("u", "rag") for _ in range(6)]
+        assert all(result.allowed for result in results)
+        assert not limiter.take("u", "rag").allowed
+    finally:
+        limiter.close()
+
+
+def test_workers_share_buckets_through_the_database(tmp_path):
+    worker = make_limiter(tmp_path, agent_per_minute=1, agent_burst=2)
+    other_worker = make_limiter(tmp_path, agent_per_minute=1, agent_burst=2)
+    try:
+        assert worker.take("u", "rag").allowed
+        assert other_worker.take("u", "rag").allowed
+        assert not worker.take("u", "rag").allowed
+    finally:
+        worker.close()
+        other_worker.close()
+
+
+def test_check_takes_in_a_thread_and_raises_when_limited(tmp_path):
+    limiter = make_limiter(tmp_path, agent_per_minute=1, agent_burst=1)
+    take = limiter.take
+    threads = []
+
+    def recording_take(*args):
+        threads.append(threading.get_ident())
+        return take(*args)
+
+    limiter.take = recording_take
+
+    async def scenario():
+        assert (await limiter.check("u", "rag")).allowed
+        with pytest.raises(RateLimited) as error:
+            await limiter.check("u", "rag")
+        assert error.value.result.retry_after == 60
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        limiter.close()
+    # the sqlite transaction never ran on the event loop's thread
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
@@ -0,0 +1,30 @@
+import os
+
+from registry import AgentRegistry
+
+
+def test_database_is_created_on_open_not_construction(tmp_path):
+    path = str(tmp_path / "agent_registry.db")
+    registry = AgentRegistry(path, seed_urls={("u", "rag"): "https://rag"})
+    assert not os.path.exists(path)
+
+    registry.open()
+    try:
+        assert registry.get_agent_urls("u", "rag") == ["https://rag"]
+    finally:
+        registry.close()
+    registry.close()  # closing twice, e.g. after a failed startup, is fine
+
+
+def test_writes_of_another_worker_drop_the_cache(tmp_path):
+    path = str(tmp_path / "agent_registry.db")
+    worker, other_worker = AgentRegistry(path), AgentRegistry(path)
+    worker.open()
+    other_worker.open()
+    try:
+        assert worker.get_agent_urls("u", "rag") == []
+        other_worker.save_agent_url("u", "rag", "https://rag")
+        assert worker.get_agent_urls("u", "rag") == ["https://rag"]
+    finally:
+        worker.close()
+        other_worker.close()
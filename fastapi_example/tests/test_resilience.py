@@ -0,0 +1,141 @@
+import asyncio
+
+import httpx
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamError, UpstreamGuard
+
+
+URL = "https://agent.example"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.monotonic() for the breakers, advanced by the test"""
+    now = [1000.0]
+    monkeypatch.setattr("resilience.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_after_consecutive_failures_only(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_half_open_lets_a_probe_through_after_the_cool_down(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, half_open_probes=1)
+    breaker.record_failure()
+    clock[0] += 30
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_opens_the_circuit_again(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == 30
+
+
+def test_neutral_outcome_frees_the_probe_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+
+    breaker.record_exception(asyncio.CancelledError())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize(
+    "exc, state",
+    [
+        (httpx.ConnectError("refused"), "open"),
+        (httpx.ReadTimeout("slow"), "open"),
+        (UpstreamError(503, "unavailable"), "open"),
+        (UpstreamError(429, "overloaded"), "open"),
+        (UpstreamError(404, "no session"), "closed"),
+        (ValueError("bad answer"), "closed"),
+    ],
+)
+def test_which_errors_count_against_the_agent(clock, exc, state):
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_exception(exc)
+    assert breaker.state == state
+
+
+def test_guard_fails_fast_while_open(clock):
+    guard = UpstreamGuard()
+    guard._breakers[URL] = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with pytest.raises(httpx.ConnectError):
+        with guard.guard(URL):
+            raise httpx.ConnectError("refused")
+
+    calls = []
+
+    async def fn(timeout):
+        calls.append(timeout)
+
+    with pytest.raises(CircuitOpenError) as error:
+        asyncio.run(guard.call(URL, "run", 60, fn))
+    assert error.value.retry_after == 30
+    assert calls == []
+    assert guard.snapshot()[URL]["state"] == "open"
+
+
+def test_timeout_is_the_ceiling_until_there_are_enough_samples():
+    guard = UpstreamGuard(multiplier=3, min_samples=20, min_timeouts={"run": 1})
+    for _ in range(19):
+        guard.latency(URL, "run").record(1000)
+    assert guard.timeout(URL, "run", ceiling=60) == 60
+
+    guard.latency(URL, "run").record(1000)
+    assert guard.timeout(URL, "run", ceiling=60) == 3  # p99 1s * 3
+
+
+def test_adaptive_timeout_is_clamped_to_floor_and_ceiling():
+    guard = UpstreamGuard(multiplier=3, min_samples=1, min_timeouts={"run": 30})
+    guard.latency(URL, "run").record(100)
+    assert guard.timeout(URL, "run", ceiling=60) == 30
+
+    guard.latency(URL, "session").record(100_000)
+    assert guard.timeout(URL, "session", ceiling=60) == 60
+
+
+def test_call_passes_the_timeout_and_records_latency():
+    guard = UpstreamGuard(min_samples=1, min_timeouts={})
+    timeouts = []
+
+    async def fn(timeout):
+        timeouts.append(timeout)
+        return "answer"
+
+    async def scenario():
+        assert await guard.call(URL, "run", 60, fn) == "answer"
+        assert await guard.call(URL, "run", 60, fn) == "answer"
+
+    asyncio.run(scenario())
+    assert timeouts[0] == 60
+    assert timeouts[1] < 60  # derived from the first call's latency
+    assert len(guard.latency(URL, "run")) == 2
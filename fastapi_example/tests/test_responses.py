@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from responses import ClosingStreamingResponse
+
+
+SCOPE = {"type": "http", "asgi": {"spec_version": "2.4"}}
+
+
+async def receive():
+    await asyncio.Event().wait()
+
+
+def run_response(send, body):
+    closed = []
+    started = []
+
+    async def stream():
+        started.append(True)
+        yield body
+
+    response = ClosingStreamingResponse(stream(), on_close=lambda: closed.append(1))
+
+    async def scenario():
+        await response(SCOPE, receive, send)
+
+    return scenario, closed, started
+
+
+def test_on_close_runs_after_a_complete_response():
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scenario, closed, _ = run_response(send, "data")
+    asyncio.run(scenario())
+
+    assert closed == [1]
+    assert messages[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+def test_on_close_runs_when_the_client_left_before_the_body_started():
+    async def send(message):
+        raise OSError("client disconnected")
+
+    scenario, closed, started = run_response(send, "data")
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(scenario())
+
+    assert started == []  # a finally in the generator would never have run
+    assert closed == [1]
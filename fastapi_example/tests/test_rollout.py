@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from google.api_core.exceptions import NotFound
+from google.cloud import run_v2
+
+import main
+from models import DeployRequest, DeployRequestInner
+from rollout import (
+    CONFIG_HASH_ANNOTATION,
+    config_fingerprint,
+    pin_image,
+    serves_latest,
+    split_image,
+    stable_service_name,
+    traffic_split,
+)
+
+
+IMAGE = "europe-docker.pkg.dev/project/repo/agent:latest"
+DIGEST = "sha256:" + "a" * 64
+PARENT = "projects/p/locations/europe-west3"
+LATEST = run_v2.TrafficTargetAllocationType.TRAFFIC_TARGET_ALLOCATION_TYPE_LATEST
+
+
+class FakeOperation:
+    def __init__(self, service: run_v2.Service):
+        self.operation = type("Operation", (), {"name": "operations/1"})()
+        self.service = service
+
+    async def result(self):
+        return self.service
+
+
+class FakeServicesClient:
+    """Fake ServicesAsyncClient keeping one service per name"""
+
+    def __init__(self):
+        self.services: dict[str, run_v2.Service] = {}
+        self.calls: list[str] = []
+
+    async def get_service(self, name):
+        self.calls.append("get")
+        if name not in self.services:
+            raise NotFound(name)
+        return run_v2.Service(self.services[name])
+
+    async def create_service(self, parent, service, service_id):
+        self.calls.append("create")
+        service = run_v2.Service(service)
+        service.name = f"{parent}/services/{service_id}"
+        return self._deploy(service)
+
+    async def update_service(self, service):
+        self.calls.append("update")
+        return self._deploy(run_v2.Service(service))
+
+    def _deploy(self, service):
+        revision = f"{service.name}/revisions/r{len(self.calls)}"
+        if service.template.containers:
+            service.latest_created_revision = revision
+            service.latest_ready_revision = revision
+        if not service.traffic:
+            service.traffic = [run_v2.TrafficTarget(type_=LATEST, percent=100)]
+        service.uri = "https://agent.run.app"
+        self.services[service.name] = service
+        return FakeOperation(service)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeServicesClient()
+    monkeypatch.setattr(main, "get_services_client", lambda: client)
+
+    async def resolve(pool, image):
+        return DIGEST
+
+    monkeypatch.setattr(main, "resolve_image_digest", resolve)
+    return client
+
+
+def deploy(request: DeployRequestInner, reports: list[str] | None = None):
+    report = (lambda message: None) if reports is None else reports.append
+    return asyncio.run(
+        main.update_service_in_place(request, PARENT, "user@example.com", report)
+    )
+
+
+def test_service_name_is_stable_and_valid():
+    name = stable_service_name("My_Agent", "User@Example.com")
+    assert name == stable_service_name("My_Agent", "user@example.com")
+    assert name.startswith("my-agent-") and len(name) <= 49
+    assert name != stable_service_name("My_Agent", "other@example.com")
+
+
+@pytest.mark.parametrize(
+    "image, parts",
+    [
+        (IMAGE, ("europe-docker.pkg.dev/project/repo/agent", "latest")),
+        ("host:5000/repo/agent", ("host:5000/repo/agent", "latest")),
+        (f"host/agent@{DIGEST}", ("host/agent", DIGEST)),
+    ],
+)
+def test_split_image(image, parts):
+    assert split_image(image) == parts
+
+
+def test_pinned_image_and_fingerprint_follow_the_digest():
+    pinned = pin_image(IMAGE, DIGEST)
+    assert pinned == f"europe-docker.pkg.dev/project/repo/agent@{DIGEST}"
+    assert pin_image(IMAGE, None) == IMAGE
+
+    request = DeployRequestInner(agent_name="rag", image=IMAGE)
+    assert config_fingerprint(request, pinned) == config_fingerprint(request, pinned)
+    assert config_fingerprint(request, pinned) != config_fingerprint(request, IMAGE)
+    changed = request.model_copy(update={"env_vars": {"MODEL": "new"}})
+    assert config_fingerprint(changed, pinned) != config_fingerprint(request, pinned)
+
+
+def test_traffic_split_keeps_the_rest_on_the_previous_revision():
+    targets = traffic_split(10, f"{PARENT}/services/s/revisions/r1")
+    assert [(t.percent, t.revision) for t in targets] == [(10, ""), (90, "r1")]
+    assert [t.percent for t in traffic_split(100, "r1")] == [100]
+
+    service = run_v2.Service(
+        latest_created_revision="r2", latest_ready_revision="r2", traffic=targets
+    )
+    assert not serves_latest(service)
+    service.traffic = traffic_split(100, "r1")
+    assert serves_latest(service)
+
+
+def test_first_deploy_creates_the_service_pinned_by_digest(client):
+    service = deploy(DeployRequestInner(agent_name="rag", image=IMAGE))
+
+    assert client.calls == ["get", "create"]
+    assert service.template.containers[0].image.endswith(f"@{DIGEST}")
+    assert service.annotations[CONFIG_HASH_ANNOTATION]
+
+
+def test_unchanged_redeploy_skips_the_rollout(client):
+    request = DeployRequestInner(agent_name="rag", image=IMAGE)
+    deploy(request)
+    reports = []
+    deploy(request, reports)
+
+    assert client.calls == ["get", "create", "get"]
+    assert "skipping rollout" in reports[-1]
+
+
+def test_changed_config_rolls_out_in_traffic_steps(client):
+    request = DeployRequestInner(agent_name="rag", image=IMAGE)
+    deploy(request)
+    changed = request.model_copy(
+        update={
+            "env_vars": {"MODEL": "new"},
+            "traffic_steps": [10, 100],
+            "traffic_step_interval": 0,
+        }
+    )
+    service = deploy(changed)
+
+    assert client.calls == ["get", "create", "get", "update", "update"]
+    assert serves_latest(service)
+
+
+def test_invalid_deploy_options_are_a_422_without_the_payload(monkeypatch):
+    secrets = {"KEY": "secret"}
+    monkeypatch.setattr(main, "get_env_vars_for_agent", lambda name: secrets)
+    request = DeployRequest(
+        user_email="user@example.com", agent_name="rag", traffic_steps=[50, 10]
+    )
+    with pytest.raises(HTTPException) as error:
+        main.get_deploy_request_inner("rag", request)
+
+    assert error.value.status_code == 422
+    assert "secret" not in str(error.value.detail)
+    assert all("input" not in item for item in error.value.detail)
@@ -0,0 +1,132 @@
+import asyncio
+import random
+from collections import Counter
+
+import httpx
+import pytest
+
+from resilience import UpstreamError
+from routing import ReplicaRouter
+
+
+FAST, SLOW, DOWN = "https://fast", "https://slow", "https://down"
+
+
+class FakeProbe:
+    """Fake health probe: fails while the url is in `failing`"""
+
+    def __init__(self, *failing):
+        self.failing = set(failing)
+        self.calls = []
+
+    async def __call__(self, agent_url: str):
+        self.calls.append(agent_url)
+        if agent_url in self.failing:
+            raise httpx.ConnectError("refused")
+
+
+def make_router(probe=None, **kwargs):
+    settings = dict(eject_failures=3, probe_interval=0.01, rng=random.Random(1))
+    settings.update(kwargs)
+    return ReplicaRouter(probe=probe or FakeProbe(), **settings)
+
+
+def fail(router, agent_url, exc=None):
+    with pytest.raises(Exception):
+        with router.track(agent_url):
+            raise exc or httpx.ConnectError("refused")
+
+
+def test_power_of_two_choices_prefers_the_faster_replica():
+    router = make_router()
+    router.record_success(FAST, 100)
+    router.record_success(SLOW, 1000)
+
+    picks = Counter(router.pick([FAST, SLOW]) for _ in range(100))
+    assert picks == {FAST: 100}
+
+
+def test_in_flight_calls_make_a_replica_look_slower():
+    router = make_router()
+    router.record_success(FAST, 100)
+    router.record_success(SLOW, 300)
+    for _ in range(3):
+        router.stats(FAST).in_flight += 1  # 100ms * 4 > 300ms * 1
+
+    assert router.pick([FAST, SLOW]) == SLOW
+
+
+def test_unknown_replicas_look_like_an_average_one():
+    router = make_router()
+    router.record_success(FAST, 100)
+    router.record_success(SLOW, 300)
+    new = "https://new"
+
+    assert router.score(new, default_ms=200) == 200
+    picks = Counter(router.pick([FAST, SLOW, new]) for _ in range(300))
+    # the slow replica only wins against nobody, the new one against it
+    assert picks[FAST] > picks[new] > picks[SLOW] == 0
+
+
+def test_track_feeds_the_latency_average():
+    router = make_router(alpha=0.5)
+    router.record_success(FAST, 100)
+    router.record_success(FAST, 300)
+    assert router.stats(FAST).ewma_ms == 200
+
+    with router.track(FAST, sample_latency=False):
+        assert router.stats(FAST).in_flight == 1
+    assert router.stats(FAST).in_flight == 0
+    assert router.stats(FAST).ewma_ms == 200
+
+
+def test_only_replica_failures_count_towards_ejection():
+    async def scenario():
+        router = make_router()
+        for _ in range(5):
+            fail(router, FAST, UpstreamError(404, "no session"))
+            fail(router, FAST, ValueError("bad answer"))
+        assert not router.stats(FAST).ejected
+        assert router.stats(FAST).failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_failing_replica_is_ejected_then_probed_back_in():
+    async def scenario():
+        probe = FakeProbe(DOWN)
+        router = make_router(probe)
+        router.record_success(DOWN, 10)
+        for _ in range(3):
+            fail(router, DOWN, UpstreamError(503, "unavailable"))
+        assert router.stats(DOWN).ejected
+        assert all(router.pick([FAST, DOWN]) == FAST for _ in range(20))
+
+        await asyncio.sleep(0.05)
+        assert router.stats(DOWN).ejected
+        assert probe.calls and set(probe.calls) == {DOWN}
+
+        probe.failing.clear()
+        await asyncio.sleep(0.05)
+        stats = router.stats(DOWN)
+        assert (stats.ejected, stats.failures, stats.ewma_ms) == (False, 0, None)
+        probes = len(probe.calls)
+        await asyncio.sleep(0.03)
+        assert len(probe.calls) == probes  # restored, probing stopped
+        await router.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_ejected_replicas_are_used_when_nothing_else_is_left():
+    async def scenario():
+        router = make_router(FakeProbe(DOWN, SLOW))
+        for agent_url in (DOWN, SLOW):
+            for _ in range(3):
+                fail(router, agent_url)
+        assert router.pick([DOWN]) == DOWN
+        assert router.pick([DOWN, SLOW]) in (DOWN, SLOW)
+        await router.aclose()
+        assert all(task.done() for task in router._probes.values())
+
+    asyncio.run(scenario())
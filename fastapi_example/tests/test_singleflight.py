@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class CountingCall:
+    """Fake upstream call: counts invocations, finishes when released"""
+
+    def __init__(self, result="answer"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_identical_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flights = SingleFlight()
+        fn = CountingCall()
+        waiters = [asyncio.create_task(flights.do("key", fn)) for _ in range(50)]
+        await settle()
+        fn.release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert fn.calls == 1
+        assert results == ["answer"] * 50
+        assert (flights.started, flights.shared) == (1, 49)
+        assert flights.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_and_no_key_are_not_shared():
+    async def scenario():
+        flights = SingleFlight()
+        fn = CountingCall()
+        waiters = [
+            asyncio.create_task(flights.do(key, fn)) for key in ("a", "b", None, None)
+        ]
+        await settle()
+        fn.release.set()
+        await asyncio.gather(*waiters)
+
+        assert fn.calls == 4
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller_and_free_the_key():
+    async def scenario():
+        flights = SingleFlight()
+        fn = CountingCall(result=RuntimeError("agent down"))
+        waiters = [asyncio.create_task(flights.do("key", fn)) for _ in range(3)]
+        await settle()
+        fn.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flights.in_flight() == 0
+        with pytest.raises(RuntimeError):
+            await flights.do("key", fn)
+        assert fn.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_call_survives_while_one_caller_is_left():
+    async def scenario():
+        flights = SingleFlight()
+        fn = CountingCall()
+        leaving = asyncio.create_task(flights.do("key", fn))
+        staying = asyncio.create_task(flights.do("key", fn))
+        await settle()
+        leaving.cancel()
+        await settle()
+        fn.release.set()
+
+        assert await staying == "answer"
+        assert leaving.cancelled()
+        assert fn.cancelled == 0
+
+    asyncio.run(scenario())
+
+
+def test_call_is_cancelled_when_every_caller_has_gone():
+    async def scenario():
+        flights = SingleFlight()
+        fn = CountingCall()
+        waiters = [asyncio.create_task(flights.do("key", fn)) for _ in range(3)]
+        await settle()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await settle()
+
+        assert fn.cancelled == 1
+        assert flights.in_flight() == 0
+
+        # a new caller starts a fresh call instead of joining the cancelled one
+        fn.release.set()
+        assert await flights.do("key", fn) == "answer"
+        assert fn.calls == 2
+
+    asyncio.run(scenario())
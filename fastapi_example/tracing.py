@@ -0,0 +1,108 @@
+import importlib.util
+import logging
+import os
+
+import httpx
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from metrics import route_template
+
+
+logger = logging.getLogger(__name__)
+
+
+# Spans are exported over OTLP/HTTP once an endpoint is set, e.g.
+# http://localhost:4318 for benchmarks/otlp_collector.py. The exporter also
+# reads the other standard OTEL_* variables (headers, sampler, ...)
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.environ.get(
+    "OTEL_EXPORTER_OTLP_ENDPOINT", ""
+)
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "adk-gateway")
+# Newer FastAPI releases open (and continue) the server span themselves
+FASTAPI_TRACES_REQUESTS = importlib.util.find_spec("fastapi.telemetry") is not None
+
+
+tracer = trace.get_tracer("adk-gateway")
+
+
+def configure_tracing():
+    """Install an OTLP exporting tracer provider, None if tracing stays off.
+
+    Needs the optional opentelemetry-sdk and OTLP exporter packages
+    (`tracing` extra); without them, or without an endpoint, spans are no-ops.
+    """
+    if not OTLP_ENDPOINT:
+        return None
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "OTLP endpoint set but opentelemetry-sdk / exporter not installed, "
+            "tracing disabled"
+        )
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Exporting traces to {OTLP_ENDPOINT}")
+    return provider
+
+
+async def inject_trace_context(request: httpx.Request):
+    """httpx request hook sending the current span as W3C traceparent"""
+    propagate.inject(request.headers)
+
+
+def mark_error(description: str):
+    """Flag the current span as failed, for errors returned instead of raised"""
+    trace.get_current_span().set_status(Status(StatusCode.ERROR, description))
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per request.
+
+    An incoming W3C traceparent is continued, so a frontend's trace runs
+    through the gateway and, via `inject_trace_context`, into the agent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        route = route_template(scope)
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            f"{method} {route}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.request.method": method,
+                "http.route": route,
+                "url.path": scope["path"],
+            },
+        ) as span:
+
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    span.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
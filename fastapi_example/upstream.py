@@ -0,0 +1,78 @@
+import importlib.util
+import os
+from urllib.parse import urlsplit
+
+import httpx
+
+from tracing import inject_trace_context
+
+
+# Pool settings for upstream agent connections, overridable via env
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.environ.get("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional h2 package (httpx[http2])
+UPSTREAM_HTTP2 = (
+    os.environ.get("UPSTREAM_HTTP2", "1") == "1"
+    and importlib.util.find_spec("h2") is not None
+)
+UPSTREAM_DEFAULT_TIMEOUT = float(os.environ.get("UPSTREAM_DEFAULT_TIMEOUT", "300"))
+
+
+def get_origin(url: str) -> str:
+    """Return scheme://host[:port] of the url, used as the pool key"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class UpstreamClientPool:
+    """Keeps one long-lived httpx.AsyncClient per agent origin.
+
+    Clients are created lazily on first use, so every request to the same
+    Cloud Run service reuses warm keep-alive (and HTTP/2) connections instead
+    of paying TCP+TLS setup each time.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry: float = UPSTREAM_KEEPALIVE_EXPIRY,
+        http2: bool = UPSTREAM_HTTP2,
+        timeout: float = UPSTREAM_DEFAULT_TIMEOUT,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._closed = False
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for the origin of the given url"""
+        if self._closed:
+            raise RuntimeError("Upstream client pool is closed")
+
+        origin = get_origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            # plain http origins (local agents) don't negotiate h2 anyway
+            client = httpx.AsyncClient(
+                http2=self.http2 and origin.startswith("https://"),
+                limits=self.limits,
+                timeout=self.timeout,
+                event_hooks={"request": [inject_trace_context]},
+            )
+            self._clients[origin] = client
+        return client
+
+    async def aclose(self):
+        """Close every pooled client, called on app shutdown"""
+        self._closed = True
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
@@ -0,0 +1,30 @@
+import os
+import time
+
+
+# Cloud Run scales an idle service to zero after roughly 15 minutes
+COLD_START_IDLE_SECONDS = float(os.environ.get("COLD_START_IDLE_SECONDS", "900"))
+
+
+class WarmupTracker:
+    """Remembers when each agent url last served a request.
+
+    A request to an url that was idle for longer than `idle_seconds` (or
+    never contacted by this worker) most likely hits a cold instance.
+    """
+
+    def __init__(self, idle_seconds: float = COLD_START_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._last_contact: dict[str, float] = {}
+
+    def is_cold(self, agent_url: str) -> bool:
+        last_contact = self._last_contact.get(agent_url)
+        return last_contact is None or (
+            time.monotonic() - last_contact > self.idle_seconds
+        )
+
+    def start_label(self, agent_url: str) -> str:
+        return "cold" if self.is_cold(agent_url) else "warm"
+
+    def touch(self, agent_url: str):
+        self._last_contact[agent_url] = time.monotonic()
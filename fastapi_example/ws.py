@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator, Callable
+
+import httpx
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from models import QueryRequest, WsQueryMessage, WsServerMessage
+
+
+# Replies buffered per connection before conversations wait for the client
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", "64"))
+# Conversations one connection may have running at the same time
+WS_MAX_CONVERSATIONS = int(os.environ.get("WS_MAX_CONVERSATIONS", "16"))
+
+
+ConversationRunner = Callable[[QueryRequest], AsyncIterator[tuple[str, dict]]]
+
+
+class ConversationMux:
+    """Multiplexes agent conversations over one WebSocket.
+
+    The client sends `{"type": "query", "id": ..., <QueryRequest fields>}`
+    and may send `{"type": "cancel", "id": ...}`; every reply is a
+    WsServerMessage tagged with the conversation id: `session`, `part`s as
+    the upstream stream produces them, then `done`, `error` or `cancelled`.
+
+    Replies go through a bounded queue drained by a single writer, so a
+    client that reads slowly stalls its conversations (and with them the
+    upstream reads) instead of growing buffers in the gateway.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        runner: ConversationRunner,
+        send_queue_size: int = WS_SEND_QUEUE_SIZE,
+        max_conversations: int = WS_MAX_CONVERSATIONS,
+    ):
+        self.websocket = websocket
+        self.runner = runner
+        self.max_conversations = max_conversations
+        self._outbox: asyncio.Queue[str] = asyncio.Queue(send_queue_size)
+        self._conversations: dict[str, asyncio.Task] = {}
+
+    async def serve(self):
+        """Handle client messages until the connection closes"""
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                await self._handle(await self.websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            tasks = [*self._conversations.values(), writer]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _write(self):
+        while True:
+            message = await self._outbox.get()
+            await self.websocket.send_text(message)
+
+    async def _send(self, event: str, conversation_id: str, data: dict | None = None):
+        message = WsServerMessage(type=event, id=conversation_id, data=data or {})
+        await self._outbox.put(message.model_dump_json())
+
+    async def _handle(self, raw: str):
+        try:
+            message = json.loads(raw)
+            message_type = message.get("type", "query")
+            message_id = str(message.get("id", ""))
+        except (ValueError, AttributeError):
+            await self._send("error", "", {"error": "Messages must be JSON objects"})
+            return
+
+        if message_type == "cancel":
+            task = self._conversations.get(message_id)
+            if task is None:
+                await self._send("error", message_id, {"error": "Unknown conversation"})
+                return
+            task.cancel()
+            del self._conversations[message_id]
+            await self._send("cancelled", message_id)
+            return
+        if message_type != "query":
+            await self._send(
+                "error", message_id, {"error": f"Unknown message type {message_type}"}
+            )
+            return
+        if message_id in self._conversations:
+            await self._send(
+                "error", message_id, {"error": "Conversation id already in use"}
+            )
+            return
+        if len(self._conversations) >= self.max_conversations:
+            await self._send(
+                "error", message_id, {"error": "Too many concurrent conversations"}
+            )
+            return
+
+        try:
+            request = WsQueryMessage.model_validate(message)
+        except ValidationError as e:
+            await self._send(
+                "error",
+                message_id,
+                {"error": e.errors(include_url=False, include_context=False)},
+            )
+            return
+
+        task = asyncio.create_task(self._converse(request))
+        self._conversations[message_id] = task
+        task.add_done_callback(lambda _: self._forget(message_id, task))
+
+    def _forget(self, message_id: str, task: asyncio.Task):
+        # the id may already belong to a new conversation started after a cancel
+        if self._conversations.get(message_id) is task:
+            del self._conversations[message_id]
+
+    async def _converse(self, request: WsQueryMessage):
+        try:
+            async for event, data in self.runner(request):
+                await self._send(event, request.id, data)
+        except httpx.TimeoutException:
+            await self._send("error", request.id, {"error": "Connection timeout"})
+            return
+        except Exception as e:
+            await self._send("error", request.id, {"error": str(e)})
+            return
+        await self._send("done", request.id)
@@ -0,0 +1,129 @@
+"""Benchmark: session create and event append throughput per session backend.
+
+Runs `--events` appends in each of N concurrently created sessions, for N in
+`--concurrency`, against ADK's own SQLite session service, the pooled SQLite
+store and, with --postgres, the pooled Postgres one. Run from gcloud_deploy/
+with the agents' virtualenv active:
+
+    python bench_session_store.py
+    python bench_session_store.py --postgres postgresql://postgres@localhost/adk
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+from google.adk.cli.service_registry import get_service_registry
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.genai import types
+
+from session_store import register_session_stores
+
+
+def make_event(index: int, payload: str) -> Event:
+    return Event(
+        author="agent",
+        invocation_id=f"bench-{uuid.uuid4()}",
+        content=types.Content(role="model", parts=[types.Part(text=payload)]),
+        actions=EventActions(state_delta={"turn": index}),
+    )
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_level(service, concurrency: int, events: int, payload: str) -> dict:
+    app_name = f"bench_{uuid.uuid4().hex[:8]}"
+    create_latencies: list[float] = []
+    append_latencies: list[float] = []
+
+    async def conversation(user: int):
+        start = time.perf_counter()
+        session = await service.create_session(app_name=app_name, user_id=f"u{user}")
+        create_latencies.append(time.perf_counter() - start)
+        for index in range(events):
+            start = time.perf_counter()
+            await service.append_event(session, make_event(index, payload))
+            append_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *[conversation(user) for user in range(concurrency)], return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    # e.g. "database is locked" once too many connections write at once
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    return {
+        "errors": len(errors),
+        "first_error": str(errors[0]) if errors else "",
+        "creates_per_s": len(create_latencies) / elapsed,
+        "appends_per_s": len(append_latencies) / elapsed,
+        "append_p50_ms": percentile(append_latencies, 0.5) * 1000
+        if append_latencies
+        else 0.0,
+        "append_p99_ms": percentile(append_latencies, 0.99) * 1000
+        if append_latencies
+        else 0.0,
+    }
+
+
+async def close(service):
+    store = getattr(service, "store", None)
+    if store is not None:
+        await store.aclose()
+    elif hasattr(service, "close"):
+        await service.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--payload-bytes", type=int, default=2000)
+    parser.add_argument("--postgres", help="postgresql:// DSN of a scratch database")
+    args = parser.parse_args()
+
+    register_session_stores()
+    registry = get_service_registry()
+    payload = "x" * args.payload_bytes
+    workdir = tempfile.mkdtemp(prefix="bench_sessions_")
+    backends = {
+        "adk-sqlite": f"sqlite:///{os.path.join(workdir, 'adk.db')}",
+        "pooled-sqlite": f"pooled+sqlite:///{os.path.join(workdir, 'pooled.db')}",
+    }
+    if args.postgres:
+        backends["pooled-postgres"] = f"pooled+{args.postgres}"
+
+    print(f"{args.events} appends of {args.payload_bytes} bytes per session")
+    for name, uri in backends.items():
+        service = registry.create_session_service(uri, agents_dir=workdir)
+        print(name)
+        try:
+            for concurrency in args.concurrency:
+                result = await run_level(
+                    service, concurrency, args.events, payload
+                )
+                print(
+                    f"  sessions={concurrency:<4} "
+                    f"creates/s={result['creates_per_s']:8.1f}  "
+                    f"appends/s={result['appends_per_s']:8.1f}  "
+                    f"append p50={result['append_p50_ms']:7.2f} ms  "
+                    f"p99={result['append_p99_ms']:7.2f} ms"
+                )
+                if result["errors"]:
+                    print(
+                        f"    {result['errors']} sessions failed: "
+                        f"{result['first_error']}"
+                    )
+        finally:
+            await close(service)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
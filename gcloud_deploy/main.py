@@ -1,10 +1,33 @@
+import importlib.util
+import logging
 import os
 import uvicorn
 from google.adk.cli.fast_api import get_fast_api_app
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from session_store import register_session_stores
+
+logger = logging.getLogger(__name__)
 
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
-SESSION_SERVICE_URI = "sqlite:///./sessions.db"
+# ADK's own SQLite service by default. Opt into the pooled store with
+# pooled+sqlite:///./pooled_sessions.db or pooled+postgresql://<dsn> (see
+# session_store.py); it keeps its own tables, existing sessions.db sessions
+# are not migrated
+SESSION_SERVICE_URI = os.environ.get("SESSION_SERVICE_URI", "sqlite:///./sessions.db")
 ALLOWED_ORIGINS = ["*"]
+# OTLP/HTTP collector for agent traces, e.g. http://localhost:4318
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or os.environ.get(
+    "OTEL_EXPORTER_OTLP_ENDPOINT", ""
+)
+
+tracer = trace.get_tracer("adk-agents")
+
+if not register_session_stores() and SESSION_SERVICE_URI.startswith("pooled+"):
+    # ADK before 1.17 has no service registry to plug the store into
+    logger.warning("Pooled session store unavailable, using ADK's own SQLite one")
+    SESSION_SERVICE_URI = "sqlite:///./sessions.db"
 
 app = get_fast_api_app(
     agents_dir=AGENT_DIR,
@@ -13,5 +36,65 @@ app = get_fast_api_app(
     web=True,
 )
 
+
+def add_otlp_exporter():
+    """Also export ADK's spans (invocation, LLM and tool calls) over OTLP"""
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+        OTLPSpanExporter,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    # get_fast_api_app already installed the SDK provider for the dev UI traces
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, TracerProvider):
+        provider = TracerProvider(
+            resource=Resource.create(
+                {"service.name": os.environ.get("OTEL_SERVICE_NAME", "adk-agents")}
+            )
+        )
+        trace.set_tracer_provider(provider)
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+
+
+class TraceContextMiddleware:
+    """Continue the caller's W3C trace, so the gateway's /run span becomes
+    the parent of the agent run"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        # session ids stay out of the span name
+        path = "/apps/{app}/..." if scope["path"].startswith("/apps/") else scope["path"]
+        with tracer.start_as_current_span(
+            f"{scope['method']} {path}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        ) as span:
+
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+
+if OTLP_ENDPOINT:
+    add_otlp_exporter()
+# newer FastAPI releases continue the caller's trace themselves
+if importlib.util.find_spec("fastapi.telemetry") is None:
+    app.add_middleware(TraceContextMiddleware)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))